@@ -0,0 +1,92 @@
+# per instance material variation for instanced yarn balls. The material
+# parameters that differ between the variants of a layer are read back in the
+# shaders through PxrAttribute patterns from user attributes set on each instance
+
+
+MATERIAL_KEYS = ("disp", "colour", "spec", "surface", "hair")
+
+# PxrAttribute type enum and the output / default parameter per value type
+ATTRIBUTE_TYPES = {
+    "float": (0, "resultF", "defaultFloat"),
+    "color": (2, "resultRGB", "defaultColor"),
+}
+
+# shader defaults of parameters some layers leave unset (see shaders/disp.osl and
+# PxrSurface), so a variant that does not set them is compared at the value it renders with
+SHADER_DEFAULTS = {
+    "disp": {"float brightBias1": [0.25]},
+    "surface": {"int specularFresnelMode": [0]},
+}
+
+
+def attribute_name(index, key, param):
+    return "yarn{}_{}_{}".format(index, key, param)
+
+
+def material_params(layer, key):
+    params = dict(SHADER_DEFAULTS.get(key, {}))
+    params.update(layer[key])
+    return params
+
+
+def overridable(decl):
+    parts = decl.split()
+    return len(parts) == 2 and parts[0] in ATTRIBUTE_TYPES
+
+
+def material_structure(layer):
+    # what user attributes cannot change in the material of layer: the parameters
+    # that are set and the values of the ones that are not plain floats or colors
+    # (references, ints), variants can only share a prototype when this matches
+    return [(key, decl, None if overridable(decl) else value)
+            for key in MATERIAL_KEYS for decl, value in sorted(material_params(layer, key).items())]
+
+
+def varying_params(variants):
+    # (key, declaration) of the parameters whose values differ between the variants
+    # (material dicts of one layer with the same material_structure)
+    varying = []
+    for key in MATERIAL_KEYS:
+        params = [material_params(v, key) for v in variants]
+        for decl in sorted(params[0]):
+            if any(p[decl] != params[0][decl] for p in params):
+                varying.append((key, decl))
+    return varying
+
+
+def attribute_layer(layer, index, varying):
+    # copy of layer whose varying parameters are connected to PxrAttribute patterns,
+    # layer's own values stay as the pattern defaults
+    out = dict(layer)
+    patterns = []
+    for key, decl in varying:
+        kind, param = decl.split()
+        enum, output, default = ATTRIBUTE_TYPES[kind]
+        name = attribute_name(index, key, param)
+        patterns.append((name, {
+            "string varname": ["user:" + name],
+            "int type": [enum],
+            "{} {}".format(kind, default): material_params(layer, key)[decl],
+        }))
+        params = dict(out[key])
+        params.pop(decl, None)
+        params["reference {} {}".format(kind, param)] = ["{}:{}".format(name, output)]
+        out[key] = params
+    out["attribute_patterns"] = patterns
+    return out
+
+
+def emit_attribute_patterns(ri, layer):
+    # declared once around a whole layer, the torus and hair shaders inside pick them up
+    for name, params in layer.get("attribute_patterns", ()):
+        ri.Pattern("PxrAttribute", name, params)
+
+
+def user_attributes(layer, index, varying):
+    # the user attribute values that turn the attribute_layer of index into layer
+    return {"{} {}".format(decl.split()[0], attribute_name(index, key, decl.split()[1])):
+            material_params(layer, key)[decl] for key, decl in varying}
+
+
+def emit_hair_bxdf(ri, layer):
+    ri.Bxdf("PxrMarschnerHair", "yarnHairShader", layer["hair"])
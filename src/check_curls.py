@@ -0,0 +1,76 @@
+import argparse
+import math
+import sys
+import time
+
+import numpy as np
+
+from hair_engine import generate_hair_arrays, curl_statistics, ks_statistic
+
+
+# two sample Kolmogorov-Smirnov critical value factor at the 1% level
+KS_ONE_PERCENT = 1.628
+
+
+def hair_curves(seed, count, curls):
+    # strands of one core layer torus of image one, walked or from curl templates
+    P, nvertices, width = generate_hair_arrays(
+        np.random.default_rng(seed), count, major_radius=1.1 * 0.40510 * .125,
+        minor_radius=0.034181251 * 0.40510 * .125, hair_length=0.0075 * .125 * 1.25,
+        curls=curls)
+    return P.reshape(count, -1, 3).astype(np.float64)
+
+
+def allowed_failures(tests, level=0.01):
+    # most failures out of tests at the given level that matching distributions stay
+    # within with probability 1 - level, from the binomial tail
+    tail = 1.0
+    for k in range(tests + 1):
+        tail -= math.comb(tests, k) * level ** k * (1.0 - level) ** (tests - k)
+        if tail < level:
+            return k
+    return tests
+
+
+def compare(count, curls, seed):
+    # number of the length and curvature KS tests failing for one seed
+    start = time.time()
+    walked = hair_curves(seed, count, 0)
+    walk_time = time.time() - start
+    start = time.time()
+    templated = hair_curves(seed + 1, count, curls)
+    template_time = time.time() - start
+
+    # both sides are count strands, the template hair is compared as rendered, so a
+    # template set too small to cover the walk shows up as a curvature mismatch
+    critical = KS_ONE_PERCENT * math.sqrt(2.0 / count)
+    failed = 0
+    for name, a, b in zip(("length", "curvature"), curl_statistics(walked), curl_statistics(templated)):
+        d = ks_statistic(a, b)
+        failed += d >= critical
+        print("seed {} {}: walk mean {:.6g}, templates mean {:.6g}, KS distance {:.4f} (1% critical {:.4f}) {}".format(
+            seed, name, a.mean(), b.mean(), d, critical, "ok" if d < critical else "MISMATCH"))
+    print("seed {} {} hairs: walk {:.3f}s, {} templates {:.3f}s".format(seed, count, walk_time, curls, template_time))
+    return failed
+
+
+def main(count, curls, seed, seeds):
+    # one seed passing proves little, a 1% test also fails 1% of the time for
+    # matching distributions: run several and allow the failures chance explains
+    failed = sum(compare(count, curls, s) for s in range(seed, seed + seeds))
+    allowed = allowed_failures(2 * seeds)
+    print("{} of {} tests failed at the 1% level, {} allowed".format(failed, 2 * seeds, allowed))
+    return failed <= allowed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="compare curl template hair against the random walk generator"
+    )
+    parser.add_argument("--count", "-n", nargs="?", const=20000, default=20000, type=int, help="hairs per sample, default 20000")
+    parser.add_argument("--curls", nargs="?", const=4096, default=4096, type=int, help="number of curl templates, default 4096")
+    parser.add_argument("--seed", nargs="?", const=1, default=1, type=int, help="first random seed, default 1")
+    parser.add_argument("--seeds", nargs="?", const=20, default=20, type=int, help="number of seeds, default 20")
+    args = parser.parse_args()
+
+    sys.exit(0 if main(args.count, args.curls, args.seed, args.seeds) else 1)
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+
+from hair_engine import GENERATOR_VERSION
+from hair_compact import encode_hair, decode_hair, read_compact, write_compact
+
+
+HAIR_FILES = ("P", "nvertices", "width")
+COMPACT_FILE = "hair.yhc"
+HIDDEN_PREFIX = "hidden-" # hidden torus sets visibility.cached_hidden keeps in the cache root
+
+
+class HairCache:
+    # content addressed on disk cache for generated hair. Every entry is a directory
+    # named after the hash of everything that decides the hair, holding one .npy per
+    # array so it can be memory mapped back. The mtime of an entry is its last use,
+    # the least recently used entries are evicted once the cache is over budget_mb.
+    # compact_bits 16 (or 8) stores entries in the quantized format of hair_compact.py
+    # instead, smaller on disk but decoded on load.
+    def __init__(self, root, budget_mb=2048, compact_bits=0):
+        self.root = root
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.compact_bits = compact_bits
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(root, exist_ok=True)
+        self._size = sum(size for _, size, _ in self._entries())
+        if self._size > self.budget:
+            self.evict()
+
+    def key(self, seed, job):
+        # seed is the per torus SeedSequence, its entropy and spawn key pin the stream
+        desc = {
+            "version": GENERATOR_VERSION,
+            "compact_bits": self.compact_bits,
+            "entropy": str(seed.entropy),
+            "spawn_key": list(seed.spawn_key),
+            "job": {k: repr(v) for k, v in sorted(job.items())},
+        }
+        return hashlib.sha1(json.dumps(desc, sort_keys=True).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def load(self, key):
+        path = self._path(key)
+        try:
+            if self.compact_bits:
+                arrays = decode_hair(read_compact(os.path.join(path, COMPACT_FILE)))
+            else:
+                arrays = tuple(np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+                               for name in HAIR_FILES)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        os.utime(path) # mark as recently used
+        self.hits += 1
+        return arrays
+
+    def store(self, key, P, nvertices, width):
+        # write into a private directory first and rename it into place, so a
+        # concurrent run never sees a half written entry
+        path = self._path(key)
+        tmp = os.path.join(self.root, ".tmp-" + uuid.uuid4().hex)
+        os.makedirs(tmp)
+        if self.compact_bits:
+            write_compact(os.path.join(tmp, COMPACT_FILE),
+                          encode_hair(P, nvertices, width, self.compact_bits))
+        else:
+            for name, array in zip(HAIR_FILES, (P, nvertices, width)):
+                np.save(os.path.join(tmp, name + ".npy"), np.ascontiguousarray(array))
+        size = sum(os.path.getsize(os.path.join(tmp, f)) for f in os.listdir(tmp))
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # someone else stored the same entry first
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+
+        self._size += size
+        if self._size > self.budget:
+            self.evict()
+
+    def _entries(self):
+        # hair directories and the hidden torus json files, both count against the budget
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith(".tmp-"):
+                continue
+            if os.path.isdir(path):
+                size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            elif name.startswith(HIDDEN_PREFIX) and name.endswith(".json"):
+                size = os.path.getsize(path)
+            else:
+                continue
+            entries.append((os.path.getmtime(path), size, path))
+        return entries
+
+    @staticmethod
+    def _remove(path):
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def evict(self):
+        # drop least recently used entries until the cache fits its budget again
+        entries = sorted(self._entries())
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._size <= self.budget:
+                break
+            self._remove(path)
+            self._size -= size
+            self.evictions += 1
+
+    def clear(self):
+        for _, _, path in self._entries():
+            self._remove(path)
+        self._size = 0
+
+    def report(self):
+        return "hair cache {}: {} hits, {} misses, {} evicted, {:.1f} MB of {:.1f} MB".format(
+            self.root, self.hits, self.misses, self.evictions,
+            self._size / (1024 * 1024), self.budget / (1024 * 1024))
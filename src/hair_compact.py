@@ -0,0 +1,130 @@
+import struct
+
+import numpy as np
+
+
+# Compact hair format for the hair of one torus, all strands with the same number
+# of control points and one width.
+#
+#   header   MAGIC, then HEADER (see below)
+#   roots    uint16 (count, 3)           first control point, quantized in the box of all roots
+#   offsets  uint16 (count, ncp - 1, 3)  remaining points minus their root, quantized in
+#                                        the box of all offsets (uint8 with bits=8)
+#
+# Quantization rounds to the nearest step, step = (max - min) / (2**bits - 1) per axis,
+# so for every decoded control point and axis
+#
+#   |decoded - original| <= root_step / 2 + offset_step / 2   (+ float32 rounding)
+#
+# error_bound() returns that per axis. For the yarn ball (roots within ~0.13, offsets
+# within ~0.006) the 16-bit bound is about 1e-6, well below the 2.7e-5 hair width.
+# A 10 point strand takes 6 + 54 bytes instead of 120 as float32 (33 bytes with bits=8).
+
+MAGIC = b"YHC1"
+HEADER = struct.Struct("<IIIf3f3f3f3f") # count, ncp, bits, width, root min/step, offset min/step
+
+
+def _quantize(values, bits):
+    levels = (1 << bits) - 1
+    lo = values.min(axis=0) if len(values) else np.zeros(3)
+    hi = values.max(axis=0) if len(values) else np.zeros(3)
+    step = (hi - lo) / levels
+    safe = np.where(step > 0, step, 1.0)
+    q = np.rint((values - lo) / safe)
+    return q.astype(np.uint16 if bits > 8 else np.uint8), lo.astype(np.float32), step.astype(np.float32)
+
+
+class CompactHair:
+    # quantized hair of one torus, see the format notes at the top of the file
+    def __init__(self, count, ncp, bits, width, root_min, root_step, offset_min, offset_step,
+                 roots, offsets):
+        self.count = count
+        self.ncp = ncp
+        self.bits = bits
+        self.width = width
+        self.root_min = root_min
+        self.root_step = root_step
+        self.offset_min = offset_min
+        self.offset_step = offset_step
+        self.roots = roots
+        self.offsets = offsets
+
+    def nbytes(self):
+        return len(MAGIC) + HEADER.size + self.roots.nbytes + self.offsets.nbytes
+
+
+def encode_hair(P, nvertices, width, bits=16):
+    # vectorised encode of generate_hair_arrays output, every strand must have the
+    # same number of control points and the same width
+    nvertices = np.asarray(nvertices)
+    width = np.asarray(width)
+    count = len(nvertices)
+    ncp = int(nvertices[0]) if count else 0
+    if count and (np.any(nvertices != ncp) or np.any(width != width[0])):
+        raise ValueError("compact hair needs one control point count and one width per torus")
+    if bits not in (8, 16):
+        raise ValueError("compact hair supports 8 or 16 bit offsets, got {}".format(bits))
+
+    curves = np.asarray(P, dtype=np.float64).reshape(count, ncp, 3)
+    roots = curves[:, 0]
+    offsets = (curves[:, 1:] - roots[:, None]).reshape(-1, 3)
+
+    q_roots, root_min, root_step = _quantize(roots, 16)
+    q_offsets, offset_min, offset_step = _quantize(offsets, bits)
+
+    return CompactHair(count, ncp, bits, float(width[0]) if count else 0.0,
+                       root_min, root_step, offset_min, offset_step,
+                       q_roots, q_offsets.reshape(count, max(ncp - 1, 0), 3))
+
+
+def decode_hair(compact):
+    # back to contiguous float32 P, int32 nvertices and float32 width
+    roots = compact.root_min + compact.roots * compact.root_step.astype(np.float64)
+    offsets = compact.offset_min + compact.offsets * compact.offset_step.astype(np.float64)
+
+    curves = np.empty((compact.count, compact.ncp, 3), dtype=np.float32)
+    curves[:, 0] = roots
+    curves[:, 1:] = roots[:, None] + offsets
+
+    nvertices = np.full(compact.count, compact.ncp, dtype=np.int32)
+    width = np.full(compact.count, compact.width, dtype=np.float32)
+    return curves.reshape(-1), nvertices, width
+
+
+def error_bound(compact):
+    # worst case absolute error per axis of any decoded control point
+    return compact.root_step / 2.0 + compact.offset_step / 2.0
+
+
+def write_compact(path, compact):
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(HEADER.pack(compact.count, compact.ncp, compact.bits, compact.width,
+                            *compact.root_min, *compact.root_step,
+                            *compact.offset_min, *compact.offset_step))
+        f.write(np.ascontiguousarray(compact.roots).tobytes())
+        f.write(np.ascontiguousarray(compact.offsets).tobytes())
+
+
+def read_compact(path, mmap=True):
+    # the quantized arrays are memory mapped straight from the file
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not a compact hair file".format(path))
+        fields = HEADER.unpack(f.read(HEADER.size))
+
+    count, ncp, bits, width = fields[:4]
+    vecs = [np.array(fields[4 + 3 * i:7 + 3 * i], dtype=np.float32) for i in range(4)]
+
+    offset = len(MAGIC) + HEADER.size
+    dtype = np.uint16 if bits > 8 else np.uint8
+    load = np.memmap if mmap and count else _fromfile
+    roots = load(path, dtype=np.uint16, mode="r", offset=offset, shape=(count, 3))
+    offset += count * 3 * 2
+    offsets = load(path, dtype=dtype, mode="r", offset=offset, shape=(count, max(ncp - 1, 0), 3))
+
+    return CompactHair(count, ncp, bits, width, vecs[0], vecs[1], vecs[2], vecs[3], roots, offsets)
+
+
+def _fromfile(path, dtype, mode, offset, shape):
+    return np.fromfile(path, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
@@ -0,0 +1,332 @@
+import functools
+import math
+import random
+import numpy as np
+
+from spatial_hash import HashGrid
+
+
+# bump this whenever the hair produced for a given seed/parameter set changes
+GENERATOR_VERSION = 2
+
+
+def rng_from_random():
+    # numpy stream seeded from the global random stream so random.seed() still makes runs repeatable
+    return np.random.default_rng(random.getrandbits(64))
+
+
+def _torus_points(major_radius, minor_radius, u, v):
+    cos_u, sin_u = np.cos(u), np.sin(u)
+    cos_v, sin_v = np.cos(v), np.sin(v)
+
+    ring = major_radius + minor_radius * cos_v
+    roots = np.stack((ring * cos_u, ring * sin_u, minor_radius * sin_v), axis=1)
+
+    # outward pointing surface normals at the sampled points
+    norms = np.stack((cos_u * cos_v, sin_u * cos_v, sin_v), axis=1)
+
+    return roots, norms
+
+
+def sample_torus_np(rng, major_radius=1.0, minor_radius=0.3, count=500):
+    # all roots for one torus at once, same parametrisation as sample_torus
+    u = rng.uniform(0, 2 * math.pi, count) # angle around the major radius
+    v = rng.uniform(0, 2 * math.pi, count) # angle around the minor radius
+
+    return _torus_points(major_radius, minor_radius, u, v)
+
+
+def _area_uv(rng, major_radius, minor_radius, count):
+    # u uniform, v with density proportional to the area element R + r cos v,
+    # by rejection against the outer equator R + r
+    u = rng.uniform(0, 2 * math.pi, count)
+    v = np.empty(count)
+    outer = major_radius + minor_radius
+    filled = 0
+    while filled < count:
+        need = count - filled
+        cand = rng.uniform(0, 2 * math.pi, int(need * outer / major_radius * 1.1) + 16)
+        keep = cand[rng.uniform(0, outer, len(cand)) < major_radius + minor_radius * np.cos(cand)]
+        keep = keep[:need]
+        v[filled:filled + len(keep)] = keep
+        filled += len(keep)
+    return u, v
+
+
+def sample_torus_area(rng, major_radius=1.0, minor_radius=0.3, count=500):
+    # uniform per unit surface area, the plain u/v draw crowds the inner side of the torus
+    u, v = _area_uv(rng, major_radius, minor_radius, count)
+    return _torus_points(major_radius, minor_radius, u, v)
+
+
+# random sequential packing of disks jams at about 54.7% coverage but only approaches
+# it slowly, aim well below it
+POISSON_COVERAGE = 0.547 / 1.6
+
+
+def poisson_radius(major_radius, minor_radius, count):
+    # minimum root spacing for count roots on the torus
+    area = 4 * math.pi * math.pi * major_radius * minor_radius
+    return math.sqrt(4 * POISSON_COVERAGE * area / (math.pi * count))
+
+
+def _poisson_select(rng, points, fixed, radius):
+    # maximal subset of points no closer than radius that keeps the first `fixed`
+    # points, built as a parallel (Luby style) independent set over the conflict
+    # pairs found with a hash grid, so every round is a few array operations
+    n = len(points)
+    grid = HashGrid(points, radius)
+    qi, pj = grid.pairs_within(points, radius)
+    other = qi != pj
+    qi, pj = qi[other], pj[other]
+
+    priority = rng.permutation(n)
+    priority[:fixed] = n # already accepted points always win
+
+    state = np.zeros(n, dtype=np.int8) # 0 undecided, 1 accepted, -1 rejected
+    state[:fixed] = 1
+    while True:
+        # anything next to an accepted point is out
+        state[pj[(state[qi] == 1) & (state[pj] == 0)]] = -1
+
+        undecided = state == 0
+        if not undecided.any():
+            break
+
+        # undecided points beating all their undecided neighbours get in
+        beaten = np.zeros(n, dtype=bool)
+        live = undecided[qi] & undecided[pj] & (priority[pj] > priority[qi])
+        beaten[qi[live]] = True
+        state[undecided & ~beaten] = 1
+
+    return state == 1
+
+
+def sample_torus_blue_noise(rng, major_radius=1.0, minor_radius=0.3, count=500, radius=None, rounds=8):
+    # Poisson disk roots: area uniform candidates thinned so no two roots are closer
+    # than radius (straight line distance), gives even coverage without clumps or gaps
+    if radius is None:
+        radius = poisson_radius(major_radius, minor_radius, count)
+
+    u = np.empty(0)
+    v = np.empty(0)
+    for _ in range(rounds):
+        need = count - len(u)
+        if need <= 0:
+            break
+        cu, cv = _area_uv(rng, major_radius, minor_radius, 4 * need)
+        u = np.concatenate((u, cu))
+        v = np.concatenate((v, cv))
+        points, _ = _torus_points(major_radius, minor_radius, u, v)
+        keep = _poisson_select(rng, points, len(u) - len(cu), radius)
+        u, v = u[keep], v[keep]
+
+    if len(u) < count:
+        # the disk radius was too large for the count, top up with area uniform roots
+        cu, cv = _area_uv(rng, major_radius, minor_radius, count - len(u))
+        u = np.concatenate((u, cu))
+        v = np.concatenate((v, cv))
+    elif len(u) > count:
+        pick = np.sort(rng.choice(len(u), count, replace=False))
+        u, v = u[pick], v[pick]
+
+    return _torus_points(major_radius, minor_radius, u, v)
+
+
+ROOT_SAMPLERS = {
+    "uniform": sample_torus_np,
+    "area": sample_torus_area,
+    "bluenoise": sample_torus_blue_noise,
+}
+
+
+def walk_directions(rng, norms, steps, jitter=0.6):
+    # (count, steps, 3) unit directions of a jittered random walk from each normal
+    count = len(norms)
+
+    # all jitter up front, (count, steps, 3)
+    kicks = rng.uniform(-jitter, jitter, (count, steps, 3))
+
+    direction = np.array(norms, dtype=np.float64)
+    directions = np.empty((count, steps, 3), dtype=np.float64)
+
+    # the walk renormalises after every kick so the steps stay sequential,
+    # but each step is a single array operation over all hairs
+    for i in range(steps):
+        direction += kicks[:, i]
+        direction /= np.sqrt(np.einsum("ij,ij->i", direction, direction))[:, None]
+        directions[:, i] = direction
+
+    return directions
+
+
+def curl_walk(rng, norms, scale, num_control_points=10, jitter=0.6):
+    # jittered random walk for every hair at once, returns (count, num_control_points, 3)
+    # relative to the root, point i sits scale * i / (num_control_points - 1) out along
+    # the walk direction after i kicks
+    directions = walk_directions(rng, norms, num_control_points, jitter)
+
+    # range of the points in the hair strand, 0/9, 1/9 etc, so from 0 to 1 in total
+    t = np.linspace(0.0, 1.0, num_control_points)
+
+    return directions * (scale[:, None] * t[None, :])[:, :, None]
+
+
+def grow_hair(rng, roots, norms, hair_length=0.02, num_control_points=10, jitter=0.6):
+    # jittered random walk for every hair at once, returns (count, num_control_points, 3)
+    count = len(roots)
+
+    # vary the length of the hairs
+    strand_length = hair_length * rng.uniform(0.5, 2.5, count)
+
+    curves = curl_walk(rng, norms, strand_length, num_control_points, jitter)
+    curves += roots[:, None, :]
+    return curves
+
+
+# curl templates are grown once from their own fixed seed, so every torus, worker
+# process and render shares the same library
+CURL_SEED = 1729
+
+# every template walk is grown long enough to cut CURL_WINDOWS hairs from it, starting
+# CURL_STEP points apart. One hair per walk fails the curvature check of
+# check_curls.py at 4096 templates, a hair then reappears about five times in a
+# sample of 20000, overlapping windows one point apart are too alike to help
+CURL_WINDOWS = 32
+CURL_STEP = 3
+
+
+def _align_to_z(v):
+    # (count, 3, 3) row vector rotations taking the unit vectors v onto +z (Rodrigues
+    # around v x z), the inverse of surface_frames without twist
+    x, y, c = v[:, 1], -v[:, 0], v[:, 2]
+    k = 1.0 / np.maximum(1.0 + c, 1e-12)
+    rot = np.empty((len(v), 3, 3))
+    rot[:, 0] = np.stack((c + k * x * x, k * x * y, -y), axis=1)
+    rot[:, 1] = np.stack((k * x * y, c + k * y * y, x), axis=1)
+    rot[:, 2] = np.stack((y, -x, c), axis=1)
+    return rot
+
+
+@functools.lru_cache(maxsize=8)
+def curl_templates(count, num_control_points=10, jitter=0.6):
+    # (count * CURL_WINDOWS, num_control_points, 3) unit length strands from a +z
+    # normal, cut from count walks. The walk direction is a Markov chain, so the
+    # directions after any point of a walk are a walk of their own from the direction
+    # at that point: a window is spaced like a hair and turned so the direction before
+    # it (the normal for the first one) points along +z. Kept in float32 like the
+    # hair, about 16 MB for 4096 walks
+    rng = np.random.default_rng(CURL_SEED)
+    up = np.tile([0.0, 0.0, 1.0], (count, 1))
+    directions = walk_directions(rng, up, num_control_points + CURL_STEP * (CURL_WINDOWS - 1), jitter)
+    directions = np.concatenate((up[:, None], directions), axis=1)
+
+    t = np.linspace(0.0, 1.0, num_control_points)
+    templates = np.empty((count, CURL_WINDOWS, num_control_points, 3), dtype=np.float32)
+    for w in range(CURL_WINDOWS):
+        start = w * CURL_STEP
+        window = directions[:, start + 1:start + 1 + num_control_points] * t[None, :, None]
+        templates[:, w] = np.matmul(window, _align_to_z(directions[:, start]))
+    templates = templates.reshape(-1, num_control_points, 3)
+    templates.setflags(write=False)
+    return templates
+
+
+def surface_frames(norms, twist):
+    # (count, 3, 3) row vector rotations taking +z onto each unit normal, turned by
+    # twist radians around it, written out instead of np.cross to keep it cheap
+    nx, ny, nz = norms[:, 0], norms[:, 1], norms[:, 2]
+
+    # a = helper x n with helper the x axis (or y when n is close to x)
+    use_y = np.abs(nx) >= 0.9
+    ax = np.where(use_y, nz, 0.0)
+    ay = np.where(use_y, 0.0, -nz)
+    az = np.where(use_y, -nx, ny)
+    inv = 1.0 / np.sqrt(ax * ax + ay * ay + az * az)
+    ax, ay, az = ax * inv, ay * inv, az * inv
+    # b = n x a
+    bx, by, bz = ny * az - nz * ay, nz * ax - nx * az, nx * ay - ny * ax
+
+    c, s = np.cos(twist), np.sin(twist)
+    frames = np.empty((len(norms), 3, 3))
+    frames[:, 0] = np.stack((c * ax + s * bx, c * ay + s * by, c * az + s * bz), axis=1)
+    frames[:, 1] = np.stack((c * bx - s * ax, c * by - s * ay, c * bz - s * az), axis=1)
+    frames[:, 2] = norms
+    return frames
+
+
+def grow_hair_from_templates(rng, roots, norms, hair_length=0.02, num_control_points=10,
+                             jitter=0.6, curls=4096):
+    # same strands as grow_hair statistically, but every hair is one of the windows
+    # cut from curls precomputed walks, turned onto its root normal with a random
+    # twist and scaled by the usual 0.5 - 2.5 length variation, no per hair walk at all
+    count = len(roots)
+    strand_length = hair_length * rng.uniform(0.5, 2.5, count)
+    pick = rng.integers(curls * CURL_WINDOWS, size=count)
+    twist = rng.uniform(0.0, 2 * math.pi, count)
+
+    frames = surface_frames(np.asarray(norms, dtype=np.float64), twist)
+    frames *= strand_length[:, None, None]
+    curves = np.matmul(curl_templates(curls, num_control_points, jitter)[pick], frames)
+    curves += roots[:, None, :]
+    return curves
+
+
+def curl_statistics(curves):
+    # (control polygon length, mean turning angle in radians) per strand
+    steps = np.diff(curves, axis=1)
+    lengths = np.sqrt(np.einsum("cij,cij->ci", steps, steps))
+    unit = steps / np.maximum(lengths, 1e-300)[..., None]
+    cos = np.clip(np.einsum("cij,cij->ci", unit[:, 1:], unit[:, :-1]), -1.0, 1.0)
+    return lengths.sum(axis=1), np.arccos(cos).mean(axis=1)
+
+
+def ks_statistic(a, b):
+    # two sample Kolmogorov-Smirnov distance between the samples a and b
+    a, b = np.sort(a), np.sort(b)
+    both = np.concatenate((a, b))
+    cdf_a = np.searchsorted(a, both, side="right") / len(a)
+    cdf_b = np.searchsorted(b, both, side="right") / len(b)
+    return float(np.max(np.abs(cdf_a - cdf_b)))
+
+
+def generate_hair_arrays(rng, count=900, major_radius=1.0,
+                         minor_radius=0.3, hair_length=0.02,
+                         hair_width=0.001, num_control_points=10, jitter=0.6,
+                         sampling="uniform", curls=0):
+    # returns contiguous float32 P (count * num_control_points * 3,),
+    # int32 nvertices (count,) and float32 width (count,) ready for ri.Curves.
+    # sampling picks the root sampler from ROOT_SAMPLERS, curls > 0 builds the
+    # strands from that many curl templates instead of walking every hair
+    roots, norms = ROOT_SAMPLERS[sampling](rng, major_radius, minor_radius, count)
+    if curls:
+        curves = grow_hair_from_templates(rng, roots, norms, hair_length, num_control_points, jitter, curls)
+    else:
+        curves = grow_hair(rng, roots, norms, hair_length, num_control_points, jitter)
+
+    P = np.ascontiguousarray(curves, dtype=np.float32).reshape(-1)
+    nvertices = np.full(count, num_control_points, dtype=np.int32)
+    width = np.full(count, hair_width, dtype=np.float32)
+
+    return P, nvertices, width
+
+
+def sample_torus(major_radius=1.0, minor_radius=0.3, count=500):
+    roots, norms = sample_torus_np(rng_from_random(), major_radius, minor_radius, count)
+
+    # return 3d coords on the torus and their normals
+    return [tuple(p) for p in roots.tolist()], [tuple(n) for n in norms.tolist()]
+
+
+def generate_hair(pts, widths, npts,
+                  count=900, major_radius=1.0,
+                  minor_radius=0.3, hair_length=0.02,
+                  hair_width=0.001):
+    # compatibility wrapper around generate_hair_arrays for the original list based
+    # signature, appends to the flat lists ri.Curves used to be fed with
+    P, nvertices, width = generate_hair_arrays(
+        rng_from_random(), count, major_radius, minor_radius, hair_length, hair_width)
+
+    pts.extend(P.tolist())
+    npts.extend(nvertices.tolist())
+    widths.extend(width.tolist())
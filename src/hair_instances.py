@@ -0,0 +1,93 @@
+import math
+
+import numpy as np
+
+from hair_engine import _torus_points, grow_hair
+from ball_material import emit_hair_bxdf
+
+
+# entropy word mixed into the layer seed for the patch stream, keeps it apart from
+# the per torus streams spawned from the same seed
+PATCH_STREAM = 0x7a7c
+
+# largest distance of an instanced hair root from its torus surface, as a fraction of
+# the tube radius
+PATCH_ROOT_ERROR = 0.02
+
+
+class HairPatches:
+    # instanced hair for one layer. A torus is symmetric around its axis, so its
+    # hair can be tiled from sleeve segments: a patch is the hair of one segment
+    # (segments per torus = hair count / patch hairs) grown around +x on a torus of
+    # the middle of the layer's major radius range, declared once with
+    # ObjectBegin/ObjectEnd. Every torus is then covered by rotating instances of
+    # randomly picked patches around its axis, pushed out (and stretched along the
+    # ring) to its own major radius. That only keeps the roots on the surface over a
+    # short arc, so the segments are never fewer than min_segments needs.
+    def __init__(self, layer, count, patches=8, patch_hairs=300, scale=1.0):
+        lo, hi = layer["rmaj"]
+        self.layer = layer
+        self.count = patches
+        self.major = 0.5 * (lo + hi) * scale
+        self.minor = layer["rmin"] * scale
+        self.spread = 0.5 * (hi - lo) * scale
+        self.segments = max(int(math.ceil(count / float(patch_hairs))), self.min_segments())
+        self.hairs = int(math.ceil(count / float(self.segments)))
+        self.scale = scale
+        self.rng = np.random.default_rng(np.random.SeedSequence([layer["seed"], PATCH_STREAM]))
+        self.handles = []
+
+    def min_segments(self):
+        # a root at angle u of a segment instanced onto major radius major + d lands
+        # d (1 - cos u) off the surface along the ring radius and minor d / major sin u
+        # along the ring, keep both under PATCH_ROOT_ERROR of the tube radius
+        if self.spread <= 0:
+            return 1
+        tol = PATCH_ROOT_ERROR * self.minor / self.spread
+        half = min(math.acos(max(-1.0, 1.0 - tol)), math.asin(min(1.0, PATCH_ROOT_ERROR * self.major / self.spread)))
+        return int(math.ceil(math.pi / half))
+
+    def grow(self):
+        # (P, nvertices, width) of one patch, roots uniform over the sleeve segment
+        half = math.pi / self.segments
+        u = self.rng.uniform(-half, half, self.hairs)
+        v = self.rng.uniform(0, 2 * math.pi, self.hairs)
+        roots, norms = _torus_points(self.major, self.minor, u, v)
+        curves = grow_hair(self.rng, roots, norms, self.layer["hair_length"])
+
+        P = np.ascontiguousarray(curves, dtype=np.float32).reshape(-1)
+        nvertices = np.full(self.hairs, curves.shape[1], dtype=np.int32)
+        width = np.full(self.hairs, self.layer["hair_width"], dtype=np.float32)
+        return P, nvertices, width
+
+    def declare(self, ri, emitter):
+        for i in range(self.count):
+            handle = "{}HairPatch{}".format(self.layer["name"].replace(" ", ""), i)
+            P, nvertices, width = self.grow()
+            ri.ObjectBegin(handle)
+            emitter.curves(nvertices, P, width)
+            ri.ObjectEnd()
+            self.handles.append(handle)
+
+    def instance(self, ri, rmaj, bxdf=True):
+        # covers one torus (inside its transform, before the torus scales) with
+        # instances, the ring is started at a random angle so seams never line up.
+        # bxdf False leaves the hair shading to an enclosing attribute block
+        major = rmaj * self.scale
+        phase = self.rng.uniform(0, 360)
+        pick = self.rng.integers(self.count, size=self.segments)
+
+        ri.AttributeBegin()
+        if bxdf:
+            emit_hair_bxdf(ri, self.layer)
+        for k, patch in enumerate(pick):
+            ri.TransformBegin()
+            ri.Rotate(phase + k * 360.0 / self.segments, 0, 0, 1)
+            ri.Translate(major - self.major, 0, 0)
+            ri.Scale(1, major / self.major, 1)
+            ri.ObjectInstance(self.handles[patch])
+            ri.TransformEnd()
+        ri.AttributeEnd()
+
+    def unique_hairs(self):
+        return self.count * self.hairs
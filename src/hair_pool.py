@@ -0,0 +1,199 @@
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from hair_engine import generate_hair_arrays
+
+
+def _job_floats(job):
+    return job["count"] * job["num_control_points"] * 3
+
+
+def _grow_into_shared(shm_name, total, offset, job, seed):
+    # worker side: write the P array of one torus straight into the shared block,
+    # only the small job description goes through pickling
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        block = np.ndarray((total,), dtype=np.float32, buffer=shm.buf)
+        P, _, _ = generate_hair_arrays(np.random.default_rng(seed), **job)
+        block[offset:offset + len(P)] = P
+        del block
+    finally:
+        shm.close()
+
+
+def _generate(jobs, seeds, pool):
+    if pool is None or len(jobs) < 2:
+        return [generate_hair_arrays(np.random.default_rng(seed), **job) for job, seed in zip(jobs, seeds)]
+
+    sizes = [_job_floats(job) for job in jobs]
+    offsets = np.concatenate(([0], np.cumsum(sizes)))
+    total = int(offsets[-1])
+
+    shm = shared_memory.SharedMemory(create=True, size=max(total, 1) * 4)
+    try:
+        futures = [pool.submit(_grow_into_shared, shm.name, total, int(offsets[i]), job, seed)
+                   for i, (job, seed) in enumerate(zip(jobs, seeds))]
+        for f in futures:
+            f.result()
+
+        # one bulk copy out of the shared block, then per torus views into it
+        P_all = np.ndarray((total,), dtype=np.float32, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+
+    hair = []
+    for i, job in enumerate(jobs):
+        P = P_all[offsets[i]:offsets[i + 1]]
+        nvertices = np.full(job["count"], job["num_control_points"], dtype=np.int32)
+        width = np.full(job["count"], job["hair_width"], dtype=np.float32)
+        hair.append((P, nvertices, width))
+    return hair
+
+
+def hair_bytes(job):
+    # size of the P, nvertices and width arrays of one job
+    return job["count"] * (job["num_control_points"] * 3 + 2) * 4
+
+
+def split_job(job, pieces):
+    # the job as pieces jobs with (nearly) equal shares of its hair count
+    counts = np.diff(np.round(np.linspace(0, job["count"], pieces + 1)).astype(int))
+    return [dict(job, count=int(count)) for count in counts]
+
+
+def _grow(seeds, jobs, pool, cache):
+    # hair for every (seed, job) pair, cache hits are loaded and the rest generated
+    hair = [None] * len(jobs)
+    todo = list(range(len(jobs)))
+
+    keys = {}
+    if cache is not None:
+        for i in todo:
+            keys[i] = cache.key(seeds[i], jobs[i])
+            hair[i] = cache.load(keys[i])
+        todo = [i for i in todo if hair[i] is None]
+
+    made = _generate([jobs[i] for i in todo], [seeds[i] for i in todo], pool)
+    for i, h in zip(todo, made):
+        if cache is not None:
+            cache.store(keys[i], *h)
+        hair[i] = h
+    return hair
+
+
+def _pieces(seed, job, count, cache):
+    # one oversized torus grown a piece at a time from child seeds of its torus seed
+    for piece_seed, piece_job in zip(seed.spawn(count), split_job(job, count)):
+        yield _grow([piece_seed], [piece_job], None, cache)[0]
+
+
+def stream_layer_hair(layer_seed, jobs, budget=0, pool=None, cache=None):
+    # hair for every torus of a layer as a generator of (torus index, pieces) in torus
+    # order, jobs holds the generate_hair_arrays arguments per torus (None for tori
+    # that get no hair). Without a pool it runs in this process, otherwise the workers
+    # of a ProcessPoolExecutor write into one shared memory block. Output is identical
+    # for any worker count, and torus i always gets seed i whatever is skipped. With a
+    # HairCache only the tori missing from the cache are generated, hits come back
+    # memory mapped. Consecutive tori are grown together while their hair fits in
+    # budget bytes and pieces is a one element list (holding None for tori without a
+    # job). A torus over budget on its own is split into pieces grown from child seeds
+    # of its seed, pieces then grows each one only when reached. budget 0 grows the
+    # whole layer at once.
+    seeds = np.random.SeedSequence(layer_seed).spawn(len(jobs))
+
+    def grown(group):
+        todo = [i for i in group if jobs[i] is not None]
+        hair = dict(zip(todo, _grow([seeds[i] for i in todo], [jobs[i] for i in todo], pool, cache)))
+        for i in group:
+            yield i, [hair.get(i)]
+
+    group, size = [], 0
+    for i, job in enumerate(jobs):
+        cost = 0 if job is None else hair_bytes(job)
+        if budget and size + cost > budget and group:
+            yield from grown(group)
+            group, size = [], 0
+        if budget and cost > budget:
+            yield i, _pieces(seeds[i], job, -(-cost // budget), cache)
+            continue
+        group.append(i)
+        size += cost
+    yield from grown(group)
+
+
+class HairPipeline:
+    # runs a (torus index, pieces) hair stream in a producer thread, so growing and
+    # filtering the upcoming tori overlaps the Ri calls of the finished ones on the
+    # calling thread. Pieces go through a queue of at most depth entries, the producer
+    # blocks once it is that far ahead. Order and output are those of the stream, the
+    # seconds each side spent blocked on the other are kept for the report.
+    _END = object()
+
+    def __init__(self, stream, depth=8):
+        self.queue = queue.Queue(maxsize=depth)
+        self.pieces = 0
+        self.producer_wait = 0.0 # generation blocked on a full queue
+        self.consumer_wait = 0.0 # emission blocked on an empty queue
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._produce, args=(stream,), daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self.producer_wait += time.perf_counter() - start
+
+    def _produce(self, stream):
+        try:
+            for i, pieces in stream:
+                for strands in pieces:
+                    self._put((i, strands))
+                self._put((i, self._END))
+        except BaseException as e:
+            # handed to the consumer, which raises it on its own thread
+            self._put((None, e))
+        self._put((None, self._END))
+
+    def _get(self):
+        start = time.perf_counter()
+        i, value = self.queue.get()
+        self.consumer_wait += time.perf_counter() - start
+        if isinstance(value, BaseException):
+            raise value
+        return i, value
+
+    def _torus(self, strands):
+        # the pieces of one torus, the first already taken from the queue
+        while strands is not self._END:
+            self.pieces += 1
+            yield strands
+            _, strands = self._get()
+
+    def __iter__(self):
+        try:
+            while True:
+                i, strands = self._get()
+                if i is None:
+                    break
+                pieces = self._torus(strands)
+                yield i, pieces
+                # whatever the consumer skipped of this torus
+                for _ in pieces:
+                    pass
+            self._thread.join()
+        finally:
+            self._stop.set()
+
+    def report(self):
+        return "{} hair pieces pipelined, generation waited {:.2f}s on a full queue, emission waited {:.2f}s on an empty queue".format(
+            self.pieces, self.producer_wait, self.consumer_wait)
@@ -0,0 +1,79 @@
+import functools
+
+import numpy as np
+
+
+# the curves use the default bezier basis: n control points make (n - 1) / 3 cubic
+# segments, so the candidate vertex counts are 4, 7 and 10
+VERTEX_COUNTS = (4, 7, 10)
+
+SAMPLES = 48 # points along a strand the fit and the error are measured at
+
+
+@functools.lru_cache(maxsize=None)
+def bezier_basis(vertices, samples=SAMPLES):
+    # (samples + 1, vertices) matrix evaluating a piecewise cubic bezier with
+    # vertices control points at evenly spaced curve parameters
+    segments = (vertices - 1) // 3
+    u = np.linspace(0.0, 1.0, samples + 1) * segments
+    seg = np.minimum(u.astype(int), segments - 1)
+    t = (u - seg)[:, None]
+    weights = np.hstack(((1 - t) ** 3, 3 * t * (1 - t) ** 2, 3 * t * t * (1 - t), t ** 3))
+
+    basis = np.zeros((len(u), vertices))
+    rows = np.arange(len(u))[:, None]
+    basis[rows, 3 * seg[:, None] + np.arange(4)] = weights
+    return basis
+
+
+@functools.lru_cache(maxsize=None)
+def _fit_matrix(vertices):
+    # least squares for the inner control points with both ends pinned
+    return np.linalg.pinv(bezier_basis(vertices)[:, 1:-1])
+
+
+def fit_strands(curves, vertices):
+    # (count, vertices, 3) control points of the best fit of every strand in curves
+    # (count, n, 3), root and tip stay exactly where they were, plus the largest
+    # distance between the fit and the original along each strand
+    samples = np.einsum("mv,cvd->cmd", bezier_basis(curves.shape[1]), curves)
+    basis = bezier_basis(vertices)
+    root, tip = curves[:, :1], curves[:, -1:]
+
+    rest = samples - basis[None, :, :1] * root - basis[None, :, -1:] * tip
+    inner = np.einsum("vm,cmd->cvd", _fit_matrix(vertices), rest)
+    fitted = np.concatenate((root, inner, tip), axis=1)
+
+    error = np.einsum("mv,cvd->cmd", basis, fitted) - samples
+    return fitted, np.sqrt(np.max(np.einsum("cmd,cmd->cm", error, error), axis=1))
+
+
+def simplify_strands(P, nvertices, width, tolerance):
+    # refits the strands of one torus (all with the same vertex count) with the
+    # fewest control points that stay within tolerance, returns new ri.Curves arrays
+    # with the strands grouped by vertex count, fewest first
+    count = len(nvertices)
+    if count == 0:
+        return P, nvertices, width
+    curves = np.asarray(P, dtype=np.float64).reshape(count, -1, 3)
+    n = curves.shape[1]
+
+    choice = np.full(count, n)
+    fits = {}
+    for vertices in reversed([v for v in VERTEX_COUNTS if v < n]):
+        fitted, error = fit_strands(curves, vertices)
+        fits[vertices] = fitted
+        choice[error <= tolerance] = vertices
+        # a strand that needs more points than this one will not fit with fewer
+        if not (error <= tolerance).any():
+            break
+
+    parts, counts, widths = [], [], []
+    for vertices in sorted(set(choice.tolist())):
+        pick = choice == vertices
+        parts.append((fits[vertices] if vertices != n else curves)[pick].reshape(-1))
+        counts.append(np.full(int(pick.sum()), vertices, dtype=np.int32))
+        widths.append(np.asarray(width)[pick])
+
+    return (np.concatenate(parts).astype(np.float32), np.concatenate(counts),
+            np.concatenate(widths).astype(np.float32))
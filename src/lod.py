@@ -0,0 +1,78 @@
+import math
+
+import numpy as np
+
+from visibility import camera_scale
+
+
+GOLDEN = 0.6180339887498949
+
+# screen space level of detail, density in hairs per pixel of projected torus
+# surface, segment in pixels of hair per control point interval. The defaults keep
+# every torus of both scenes at full detail at 1920x1080
+LOD_DEFAULTS = {
+    "density": 0.1,
+    "segment": 1.5,
+    "min_hairs": 200,
+    "max_hairs": 0, # 0 for the layer's own hair count
+    "min_points": 4,
+    "max_points": 10,
+}
+
+
+def strand_ranks(count):
+    # evenly spread value in [0, 1) per strand index (golden ratio sequence), keeping
+    # the strands with rank < p thins any run of strands evenly and the same way
+    # every render, without touching the hair random streams
+    return (np.arange(count) * GOLDEN) % 1.0
+
+
+def dof_keep(camera, layer_to_world, matrix, P, count, strength=1.0, min_keep=0.1):
+    # fraction of strands to keep around each strand of one torus: a strand blurred
+    # over b pixels by the depth of field is replaced by 1 / (strength * b) strands,
+    # never less than min_keep and never more than all of them
+    roots = np.asarray(P, dtype=np.float64).reshape(count, -1, 3)[:, 0]
+    depth = camera.to_camera(roots @ matrix[:3, :3] + matrix[3, :3], layer_to_world)[:, 2]
+    blur = camera.coc_pixels(depth)
+    return np.clip(1.0 / np.maximum(strength * blur, 1.0), min_keep, 1.0)
+
+
+def thin_strands(strands, keep):
+    # drops strands by rank against the keep fraction and widens the survivors by
+    # 1 / keep, so the expected hair coverage of every region stays the same
+    P, nvertices, width = strands
+    selected = strand_ranks(len(nvertices)) < keep
+    P = np.asarray(P).reshape(len(nvertices), -1)[selected].reshape(-1)
+    width = (np.asarray(width, dtype=np.float64) / keep)[selected].astype(np.float32)
+    return P, nvertices[selected], width
+
+
+def screen_lod(camera, layer_to_world, matrices, majors, minor, hair_length, lod):
+    # (hairs, control points) per torus from its size on screen: enough hairs to
+    # reach the density over the projected torus surface, and enough control points
+    # that the longest strand (2.5 x hair_length) has one per segment pixels
+    matrices = np.asarray(matrices)
+    depth = camera.to_camera(matrices[:, 3, :3], layer_to_world)[:, 2]
+    pixels = camera.pixels_per_unit(depth) * camera_scale(camera, layer_to_world)
+
+    area = 4 * math.pi ** 2 * np.asarray(majors) * minor * pixels ** 2
+    hairs = lod["density"] * area
+    points = np.ceil(2.5 * hair_length * pixels / lod["segment"]) + 1
+    points = np.clip(points, lod["min_points"], lod["max_points"])
+    # the curves use the default bezier basis, so only 1 + 3k control points are valid
+    return hairs, (1 + 3 * np.ceil((points - 1) / 3)).astype(int)
+
+
+def lod_jobs(jobs, hairs, points, lod):
+    # caps the hair count and control points of each hair job, widening the hairs
+    # that are left so the coverage stays the same
+    out = []
+    for job, h, n in zip(jobs, hairs, points):
+        count = min(job["count"], max(lod["min_hairs"], int(math.ceil(h))))
+        if lod["max_hairs"] > 0:
+            count = min(count, lod["max_hairs"])
+        lod_job = dict(job, count=count, num_control_points=int(min(n, job["num_control_points"])))
+        if 0 < count < job["count"]:
+            lod_job["hair_width"] = job["hair_width"] * job["count"] / count
+        out.append(lod_job)
+    return out
@@ -1,80 +1,122 @@
 #!/usr/bin/env rmanpy
-import prman
+try:
+    import prman
+except ImportError:
+    # only --stream works without RenderMan, the RIB then goes to another process
+    prman = None
 
-import sys
-import os.path, subprocess
 import argparse
 import math
-import random
+import os
 import time
-import numpy as np
 
-
-def sample_torus(major_radius=1.0, minor_radius=0.3, count=500):
-    pts, norms = [], []
-    for _ in range(count):
-        u = random.uniform(0, 2 * math.pi) # Angle around the major radius, as a full circle in radians is 2pi
-        v = random.uniform(0, 2 * math.pi) # Angle around the minor radius
-
-		# parametric equation for torus
-        x = (major_radius + minor_radius * math.cos(v)) * math.cos(u)
-        y = (major_radius + minor_radius * math.cos(v)) * math.sin(u)
-        z = minor_radius * math.sin(v)
-
-        # outward pointing surface normals at the sampled point
-        nx = math.cos(u) * math.cos(v)
-        ny = math.sin(u) * math.cos(v)
-        nz = math.sin(v)
-
-        pts.append((x, y, z))
-        norms.append((nx, ny, nz))
-	
-	# return 3d coords on the torus and their normals
-    return pts, norms
-
-
-def generate_hair(pts, widths, npts,
-                 count=900, major_radius=1.0,
-                 minor_radius=0.3, hair_length=0.02,
-                 hair_width=0.001):
-
-    # get hair root positions and normals from the torus
-    surface_pts, surface_norms = sample_torus(
-        major_radius, minor_radius, count)
-
-    # loop over each hair root
-    for (x, y, z), (nx, ny, nz) in zip(surface_pts, surface_norms):
-        jitter = 0.6  # used for curliness
-
-        # More control points for smoother and tighter curls
-        num_control_points = 10
-
-        # vary the length of the hairs
-        variation = random.uniform(0.5, 2.5)
-        strand_length = hair_length * variation
-
-        for i in range(num_control_points):
-
-            t = i / (num_control_points - 1) # range of the points in the hair strand, 0/9, 1/9 etc, so from 0 to 1 in total
-
-            # Combine with jitter and original direction for natural randomness
-            nx += random.uniform(-jitter, jitter)
-            ny += random.uniform(-jitter, jitter) 
-            nz += random.uniform(-jitter, jitter)
-
-            length = math.sqrt(nx * nx + ny * ny + nz * nz)
-            nx /= length
-            ny /= length
-            nz /= length
-
-			# move each point in the strand along the surface normal, incrementally
-            px = x + nx * strand_length * t 
-            py = y + ny * strand_length * t
-            pz = z + nz * strand_length * t
-            pts.extend([px, py, pz]) 
-
-        npts.append(num_control_points)
-        widths.append(hair_width)
+from yarn_layer import SceneBuild, emit_layer
+from ri_track import TrackedRi
+from lod import LOD_DEFAULTS
+from hair_cache import HairCache
+from rib_cache import RibCache
+from rib_stream import RibStream
+from rib_writer import RibFile
+
+
+# yarn material shared by both layers of the ball
+RED_DISP = {
+    "float scale1": [.006543],  # Larger displacement for the first spiral
+    "float repeatU1": [170],  # Repeat factor for the first spiral, 230
+    "float repeatV1": [8],  # Repeat factor for the first spiral, 10
+
+    "float scale2": [0.000625],  # 0.04
+    "float repeatU2": [150],  #
+    "float repeatV2": [-37],  # -7
+
+    "float noiseAmount1": [0.0015],   # Larger bumps noise strength
+    "float noiseFreq1": [.750],     # Larger bumps frequency
+
+    "float noiseAmount2": [0.0032],   # 0.02, can make it bigger maybe slightly
+    "float noiseFreq2": [14.0]  ,    # between 4 and 5
+
+    "float noiseAmount3": [0.0005],   # maybe 0.005 or 0.002 but maybe more just slight stripes not bumps
+    "float noiseFreq3": [100.0]      # the smallest bumps on it
+}
+
+RED_COLOUR = {
+    "float repeatU": [70],
+    "float repeatV": [-30.0],
+    "color colorA": [0.75, 0.06, 0.047],
+    "color colorB": [1, 0.075, 0.05],
+    "float noiseFreq1": [1500.750],
+}
+
+RED_SPEC = {
+    "float repeatU": [70],
+    "float repeatV": [-10.0],
+    "float noiseFreq1": [2000.750],
+    "float maskScale": [2.5],
+    "color colorA": [1, 1, 1],
+    "color colorB": [0.007, .007, .007],
+}
+
+RED_SURFACE = {
+    "float diffuseGain" : [.50],
+    "reference color diffuseColor": ["spiralColourNoise:resultRGB"],
+    "float diffuseRoughness" : [0.6],
+
+    "float fuzzGain" : [1.0],  # Increase fuzz for soft, warm look
+    "color fuzzColor" : [1.0, 0.05, 0.05],
+
+    # Subsurface scattering for fluffiness
+    "int subsurfaceType"        : [1],
+    "float subsurfaceGain"      : [0.05],
+    "color subsurfaceColor"     : [1.0, 0.075, 0.02],
+    "float subsurfaceDmfp"      : [1.0],
+
+    # Match highlight color to base — subtle red sheen
+    "color specularFaceColor" : [0.2, 0.05, 0.02],
+    "color specularEdgeColor" : [0.25, 0.06, 0.025],
+    "reference float specularRoughness": ["spiralSpecNoise:resultMask"],
+    "int specularFresnelMode" : [0],
+}
+
+RED_HAIR = {
+    'float diffuseGain': [0.2],
+    'color diffuseColor': [1.0, 0.075, 0.02],
+
+    'color specularColorR': [1.0, 1, 1],
+    'color specularColorTRT': [1.0, 0.075, 0.02],
+    'color specularColorTT': [1.0, 0.075, 0.02],
+
+    'float specularGainR': [1],
+    'float specularGainTRT': [0.7],
+    'float specularGainTT': [0.6],
+}
+
+HAIR_SCALE = .125 # derived from the torus scale, 0.125 is the scale of the yarn ball
+
+CORE_LAYER = {
+    "name": "core layer",
+    "seed": 3,
+    "num_tori": 200, # number of tori in the base layer of the yarn ball
+    "rz_wave": math.sin,
+    "rmaj": (.998, 1.2),
+    "rmin": 0.034181251,
+    "hair_count": 3000,
+    "hair_length": 0.0075 *HAIR_SCALE *1.25,
+    "hair_width": 0.000215 * HAIR_SCALE,
+    "disp": RED_DISP,
+    "colour": RED_COLOUR,
+    "spec": RED_SPEC,
+    "surface": RED_SURFACE,
+    "hair": RED_HAIR,
+}
+
+TOP_LAYER = dict(CORE_LAYER,
+    name="top layer",
+    seed=18,
+    num_tori=15, # number of tori in the top layer of the yarn ball
+    rz_wave=math.cos,
+    rmaj=(1.2, 1.3),
+    hair_count=6000,
+)
 
 
 # Main rendering routine
@@ -87,11 +129,28 @@ def main(
     height=1080,
     integrator="PxrPathTracer",
     integratorParams={},
+    build_opts={},
+    stream=None,
 ):
     print("shading rate {} pivel variance {} using {} {}".format(shadingrate, pixelvar, integrator, integratorParams))
-    ri = prman.Ri()  # create an instance of the RenderMan interface
+    # create an instance of the RenderMan interface (or a RIB stream into a separate renderer),
+    # tracking transforms for the scene builder
+    scene_rib = None
+    if stream:
+        ri = RibStream(*stream)
+    elif filename == os.devnull:
+        # --archivesonly, the scene RIB is thrown away and prman is not needed
+        ri = RibFile(build_opts.get("rib_binary", False))
+    elif filename != "__render":
+        # --rib is written here, layer by layer, without prman
+        ri = scene_rib = RibFile(build_opts.get("rib_binary", False), build_opts.get("rib_gzip", False))
+    else:
+        ri = prman.Ri()
+    ri = TrackedRi(ri)
+    build = SceneBuild(ri, scene_rib=scene_rib, **build_opts)
 
 
+    start = time.time()
     ri.Begin(filename)
     ri.Option("searchpath", {"string texture": "./textures/:@"})
 
@@ -208,7 +267,7 @@ def main(
         -1 * scale, -1, -2 * scale
     ]
 
-    ri.Polygon({
+    build.emitter.polygon({
         "P": P,
         "st": [0, 0,
             1, 0,
@@ -228,317 +287,10 @@ def main(
     ri.Scale(0.7, 0.7, 0.7)
     ri.Translate(-0.13, -.87, -1.318)
 
-    random.seed(3)  # makes randomness repeatable across runs
-
     ri.Translate(0, -.4925, 0)
 
-    num_tori3 = 200 # number of tori in the base layer of the yarn ball
-    rmaj_values = np.linspace(.8, 1.1, num_tori3)
-
-    for i in range(num_tori3):
-        rx = math.sin(i * 1.618) * 180 + random.uniform(-10, 10)
-        ry = math.cos(i * 2.718) * 180 + random.uniform(-10, 10)
-        rz = math.sin(i * 3.1415) * 180 + random.uniform(-10, 10)
-
-        tx = math.sin(i * 0.06) * 0.0001 + random.uniform(-0.00005, 0.00005)
-        ty = math.cos(i * 0.06) * 0.0001 + random.uniform(-0.00005, 0.00005)
-        tz = math.sin(i * 0.06) * 0.0001 + random.uniform(-0.00005, 0.00005)
-
-
-        ri.TransformBegin()
-        ri.Translate(tx, ty, tz)
-        ri.Rotate(rx, 1, 0, 0)
-        ri.Rotate(ry, 0, 1, 0)
-        ri.Rotate(rz, 0, 0, 1)
-
-        ri.AttributeBegin()
-        ri.TransformBegin()
-
-        ri.Attribute("displacementbound", {"float sphere": [0.02]}) # .2
-        ri.Attribute("dice", {
-            "float micropolygonlength": [0.1]
-        })
-
-        ri.Pattern(
-            "disp", "disp",
-            {
-                "float scale1": [.006543],  # Larger displacement for the first spiral
-                "float repeatU1": [170],  # Repeat factor for the first spiral, 230
-                "float repeatV1": [8],  # Repeat factor for the first spiral, 10
-
-                "float scale2": [0.000625],  # 0.04
-                "float repeatU2": [150],  # 
-                "float repeatV2": [-37],  # -7 
-
-                "float noiseAmount1": [0.0015],   # Larger bumps noise strength
-                "float noiseFreq1": [.750],     # Larger bumps frequency
-
-                "float noiseAmount2": [0.0032],   # 0.02, can make it bigger maybe slightly
-                "float noiseFreq2": [14.0]  ,    # between 4 and 5 
-
-                "float noiseAmount3": [0.0005],   # maybe 0.005 or 0.002 but maybe more just slight stripes not bumps
-                "float noiseFreq3": [100.0]      # the smallest bumps on it
-            }
-        )
-
-        ri.Displace(
-            "PxrDisplace", "pxrdisp",
-            {"reference float dispScalar": ["disp:resultF"]}
-        )
-
-
-        # colour spiral pattern to simulate strands of fibres
-        ri.Pattern(
-            "spiralColourNoise", "spiralColourNoise",
-            {
-                "float repeatU": [70], 
-                "float repeatV": [-30.0],  
-                "color colorA": [0.75, 0.06, 0.047],
-                "color colorB": [1, 0.075, 0.05],
-                "float noiseFreq1": [1500.750],
-            }
-        )
-
-        ri.Pattern(
-            "spiralSpecNoise", "spiralSpecNoise",
-            {
-                "float repeatU": [70],
-                "float repeatV": [-10.0],
-                "float noiseFreq1": [2000.750],
-                "float maskScale": [2.5],
-                "color colorA": [1, 1, 1],
-                "color colorB": [0.007, .007, .007],
-            }
-        )
-
-
-        ri.Bxdf("PxrSurface", "yarnShader",
-        {
-            "float diffuseGain" : [.50],
-            "reference color diffuseColor": ["spiralColourNoise:resultRGB"],
-            "float diffuseRoughness" : [0.6],
-
-            "float fuzzGain" : [1.0],
-            "color fuzzColor" : [1.0, 0.05, 0.05],
-
-            # Subsurface scattering for fluffiness
-            "int subsurfaceType"        : [1],     
-            "float subsurfaceGain"      : [0.05], 
-            "color subsurfaceColor"     : [1.0, 0.075, 0.02], 
-            "float subsurfaceDmfp"      : [1.0], 
-
-            # Match highlight color to base — subtle red sheen
-            "color specularFaceColor" : [0.2, 0.05, 0.02],
-            "color specularEdgeColor" : [0.25, 0.06, 0.025],
-            "reference float specularRoughness": ["spiralSpecNoise:resultMask"],
-            "int specularFresnelMode" : [0],   
-        })
-
-        # DISPLACED TORUS 
-        Rmaj3 = random.uniform(.998, 1.2)
-        ri.Scale(0.125, 0.125, 0.125)
-        ri.Scale(.40510, .40510, .40510)
-        ri.Torus(Rmaj3, 0.034181251, 0, 360, 360) 
-        ri.TransformEnd()
-        ri.AttributeEnd()
-
-
-        # YARN HAIR
-        ri.TransformBegin()
-
-        hair_scale = .125 # derived from the torus scale, 0.125 is the scale of the yarn ball
-
-        # Match the effective torus radii
-        effective_major = Rmaj3 * 0.40510 *.125
-        effective_minor = 0.034181251 * 0.40510 * .125
-        hairlength = 0.0075 *hair_scale *1.25
-        hairwidth = 0.000215 * hair_scale 
-
-
-        hair_pts, hair_widths, hair_npts = [], [], []
-
-        generate_hair(hair_pts, hair_widths, hair_npts, count=3000, major_radius=effective_major, minor_radius=effective_minor, hair_length=hairlength, hair_width=hairwidth)
-
-        ri.AttributeBegin()
-
-        ri.Bxdf('PxrMarschnerHair', 'yarnHairShader', {
-            'float diffuseGain': [0.2],                     
-            'color diffuseColor': [1.0, 0.075, 0.02],  
-
-            'color specularColorR': [1.0, 1, 1],  
-            'color specularColorTRT': [1.0, 0.075, 0.02],      
-            'color specularColorTT': [1.0, 0.075, 0.02],
-
-            'float specularGainR': [1],     
-            'float specularGainTRT': [0.7],   
-            'float specularGainTT': [0.6],    
-        })
-
-
-        # based on the lecture example on hair, these parameters are the minimum needed in the rib
-        ri.Curves("cubic", hair_npts, "nonperiodic", {
-            ri.P: hair_pts,
-            "float width": hair_widths
-        })
-
-        ri.AttributeEnd()
-        ri.TransformEnd()
-        ri.TransformEnd()
-
-
-    random.seed(18) 
-
-    num_tori2 = 15 # number of tori in the top layer of the yarn ball
-    rmaj_values = np.linspace(1.1, 1.3, num_tori2)
-
-    for i in range(num_tori2):
-        rx = math.sin(i * 1.618) * 180 + random.uniform(-10, 10)
-        ry = math.cos(i * 2.718) * 180 + random.uniform(-10, 10)
-        rz = math.cos(i * 3.1415) * 180 + random.uniform(-10, 10)
-
-        tx = math.sin(i * 0.06) * 0.0001 + random.uniform(-0.00005, 0.00005)
-        ty = math.cos(i * 0.06) * 0.0001 + random.uniform(-0.00005, 0.00005)
-        tz = math.sin(i * 0.06) * 0.0001 + random.uniform(-0.00005, 0.00005)
-
-        ri.TransformBegin()
-
-        ri.Translate(tx, ty, tz)
-        ri.Rotate(rx, 1, 0, 0)
-        ri.Rotate(ry, 0, 1, 0)
-        ri.Rotate(rz, 0, 0, 1)
-
-        ri.AttributeBegin()
-
-
-        ri.Attribute("displacementbound", {"float sphere": [0.02]}) # .2
-        ri.Attribute("dice", {
-            "float micropolygonlength": [0.1]
-        })
-
-        ri.Pattern(
-            "disp", "disp",
-            {
-                "float scale1": [.006543],
-                "float repeatU1": [170],
-                "float repeatV1": [8],
-
-                "float scale2": [0.000625],
-                "float repeatU2": [150],
-                "float repeatV2": [-37],
-
-                "float noiseAmount1": [0.0015],
-                "float noiseFreq1": [.750],
-
-                "float noiseAmount2": [0.0032],
-                "float noiseFreq2": [14.0]  , 
-
-                "float noiseAmount3": [0.0005],
-                "float noiseFreq3": [100.0]
-            }
-        )
-
-        ri.Displace(
-            "PxrDisplace", "pxrdisp",
-            {"reference float dispScalar": ["disp:resultF"]}
-        )
-
-
-        # colour spiral pattern to simulate strands of fibres
-        ri.Pattern(
-            "spiralColourNoise", "spiralColourNoise",
-            {
-                "float repeatU": [70], 
-                "float repeatV": [-30.0], 
-                "color colorA": [0.75, 0.06, 0.047],
-                "color colorB": [1, 0.075, 0.05],
-                "float noiseFreq1": [1500.750],
-            }
-        )
-
-        ri.Pattern(
-            "spiralSpecNoise", "spiralSpecNoise",
-            {
-                "float repeatU": [70], 
-                "float repeatV": [-10.0],
-                "float noiseFreq1": [2000.750],
-                "float maskScale": [2.5],
-                "color colorA": [1, 1, 1],
-                "color colorB": [0.007, .007, .007],
-            }
-        )
-
-
-        ri.Bxdf("PxrSurface", "yarnShader",
-        {
-            "float diffuseGain" : [.50],
-            "reference color diffuseColor": ["spiralColourNoise:resultRGB"],
-            "float diffuseRoughness" : [0.6],
-
-            "float fuzzGain" : [1.0],  # Increase fuzz for soft, warm look
-            "color fuzzColor" : [1.0, 0.05, 0.05],
-
-            # Subsurface scattering for fluffiness
-            "int subsurfaceType"        : [1],   
-            "float subsurfaceGain"      : [0.05],    
-            "color subsurfaceColor"     : [1.0, 0.075, 0.02],
-            "float subsurfaceDmfp"      : [1.0], 
-
-            "color specularFaceColor" : [0.2, 0.05, 0.02],
-            "color specularEdgeColor" : [0.25, 0.06, 0.025], 
-            "reference float specularRoughness": ["spiralSpecNoise:resultMask"],
-            "int specularFresnelMode" : [0],   
-        })
-
-        # DISPLACED TORUS
-        Rmaj2 = random.uniform(1.2, 1.3)
-        ri.Scale(0.125, 0.125, 0.125)
-        ri.Scale(.40510, .40510, .40510)
-        ri.Torus(Rmaj2, 0.034181251, 0, 360, 360)
-
-        ri.AttributeEnd()
-
-
-
-
-
-
-        # YARN HAIR
-        ri.TransformBegin()
-
-        hair_scale = .125
-        # Match the effective torus radii
-        effective_major = Rmaj2 * 0.40510 *.125
-        effective_minor = 0.034181251 * 0.40510 * .125
-        hairlength = 0.0075 *hair_scale *1.25
-        hairwidth = 0.000215 * hair_scale 
-
-        hair_pts, hair_widths, hair_npts = [], [], []
-
-        generate_hair(hair_pts, hair_widths, hair_npts, count=6000, major_radius=effective_major, minor_radius=effective_minor, hair_length=hairlength, hair_width=hairwidth)
-
-        ri.AttributeBegin()
-
-        ri.Bxdf('PxrMarschnerHair', 'yarnHairShader', {
-            'float diffuseGain': [0.2],                     
-            'color diffuseColor': [1.0, 0.075, 0.02],  
-
-            'color specularColorR': [1.0, 1, 1],  
-            'color specularColorTRT': [1.0, 0.075, 0.02],      
-            'color specularColorTT': [1.0, 0.075, 0.02],
-
-            'float specularGainR': [1],    
-            'float specularGainTRT': [0.7],  
-            'float specularGainTT': [0.6],      
-        })
-
-        ri.Curves("cubic", hair_npts, "nonperiodic", {
-            ri.P: hair_pts,
-            "float width": hair_widths
-        })
-
-        ri.AttributeEnd()
-        ri.TransformEnd()
-        ri.TransformEnd()
+    emit_layer(build, CORE_LAYER, covered_by=[TOP_LAYER])
+    emit_layer(build, TOP_LAYER, core=CORE_LAYER)
 
 
 
@@ -639,11 +391,17 @@ def main(
 
     ri.TransformEnd()
 
+    build.report()
+
     # end  world
     ri.WorldEnd()
 
     # and finally end the rib file
     ri.End()
+    build.close()
+
+    if filename not in ("__render", os.devnull):
+        build.record_rib(filename, time.time() - start)
 
 
 if __name__ == "__main__":
@@ -673,7 +431,124 @@ if __name__ == "__main__":
         "--height", "-ht", nargs="?", const=720, default=1080, type=int, help="height of image default 720"
     )
 
+    parser.add_argument(
+        "--hairchunk", "-c", nargs="?", const=-1, default=0, type=int,
+        help="merge the hair of N tori into one Curves call, -1 (or no value) merges a whole layer, default 0 one Curves per torus"
+    )
+
+    parser.add_argument(
+        "--workers", "-j", nargs="?", const=-1, default=0, type=int,
+        help="generate hair in a pool of N processes, -1 (or no value) uses all cores, default 0 no pool"
+    )
+    parser.add_argument(
+        "--hairbudget", nargs="?", const=256.0, default=0.0, type=float,
+        help="grow and emit the hair in chunks of about this many MB of hair arrays instead of whole layers, a soft budget and not a limit on process memory (no value: 256), default 0 whole layers"
+    )
+    parser.add_argument(
+        "--pipeline", nargs="?", const=8, default=0, type=int,
+        help="grow and filter the hair of upcoming tori in a thread while the finished ones are emitted, at most N pieces ahead (no value: 8), default 0 off"
+    )
+
+    parser.add_argument(
+        "--rootsampling", choices=["uniform", "area", "bluenoise"], default="uniform",
+        help="hair root sampling on the torus: uniform in u/v, uniform per area, or Poisson disk blue noise"
+    )
+    parser.add_argument(
+        "--hairfraction", nargs="?", const=1.0, default=1.0, type=float,
+        help="scale the number of hairs per torus, e.g. 0.6 with --rootsampling bluenoise, default 1.0"
+    )
+
+    parser.add_argument("--buried", action="count", help="drop hair rooted inside neighbouring tori of the same layer")
+    parser.add_argument(
+        "--hidden", choices=["off", "drop", "proxy"], default="off",
+        help="drop the core tori the camera cannot see, or replace them with one core sphere proxy"
+    )
+    parser.add_argument(
+        "--cull", nargs="?", const=0.1, default=None, type=float,
+        help="cull tori and hair strands outside the view or behind the ball, optional frustum margin for reflections (default 0.1)"
+    )
+    parser.add_argument(
+        "--dofthin", nargs="?", const=1.0, default=None, type=float,
+        help="thin and widen hair where the depth of field blurs it, optional strength (default 1.0)"
+    )
+    parser.add_argument(
+        "--lod", nargs="?", const=LOD_DEFAULTS["density"], default=LOD_DEFAULTS["density"], type=float,
+        help="hairs per pixel of the screen space level of detail that picks hair count and control points per torus (default 0.1)"
+    )
+    parser.add_argument("--nolod", action="count", help="turn the screen space level of detail off, every torus gets full detail")
+    parser.add_argument(
+        "--lodhairs", nargs=2, type=int, default=[LOD_DEFAULTS["min_hairs"], LOD_DEFAULTS["max_hairs"]],
+        metavar=("MIN", "MAX"), help="hair count range per torus for --lod, MAX 0 is the layer's own count"
+    )
+    parser.add_argument(
+        "--lodpoints", nargs=2, type=int, default=[LOD_DEFAULTS["min_points"], LOD_DEFAULTS["max_points"]],
+        metavar=("MIN", "MAX"), help="control point range per hair for --lod"
+    )
+    parser.add_argument(
+        "--simplify", nargs="?", const=0.00005, default=None, type=float,
+        help="refit hair strands with 4 or 7 control points where they stay within this world space tolerance (default 0.00005)"
+    )
+    parser.add_argument(
+        "--curls", nargs="?", const=4096, default=0, type=int,
+        help="build hair from N precomputed curl templates instead of walking every hair, default 0 (off), no value 4096"
+    )
+    parser.add_argument(
+        "--hairinstances", nargs="?", const=8, default=0, type=int,
+        help="instance N hair patches per layer (ObjectBegin/ObjectInstance) instead of unique hair per torus, default 0 (off), no value 8"
+    )
+    parser.add_argument(
+        "--patchhairs", nargs="?", const=300, default=300, type=int, help="strands per instanced hair patch, default 300"
+    )
+    parser.add_argument(
+        "--torusbuckets", nargs="?", const=8, default=0, type=int,
+        help="quantize the torus major radii into N buckets and instance one displaced prototype per bucket, default 0 (off), no value 8"
+    )
+    parser.add_argument("--sharedshading", action="count", help="declare the torus material and the hair Bxdf once per layer instead of once per torus")
+    parser.add_argument(
+        "--deferred", nargs="?", const="archives", default=None,
+        help="write every torus and its hair to its own RIB archive and load it through a bounded DelayedReadArchive procedural, default directory archives"
+    )
+    parser.add_argument(
+        "--archivesonly", action="count",
+        help="only write the --deferred torus archives (default directory archives) that are missing or out of date, nothing is rendered"
+    )
+
+    parser.add_argument(
+        "--haircache", nargs="?", const="hair_cache", default=None,
+        help="reuse generated hair from this cache directory (no value: ./hair_cache)"
+    )
+    parser.add_argument(
+        "--haircachemb", nargs="?", const=2048.0, default=2048.0, type=float,
+        help="disk budget of the hair cache in MB, least recently used hair is evicted, default 2048"
+    )
+    parser.add_argument(
+        "--haircompact", nargs="?", const=16, default=0, type=int,
+        help="store cached hair quantized to 16 (or 8) bit offsets, see hair_compact.py, default 0 float32"
+    )
+    parser.add_argument("--clearhaircache", action="count", help="empty the hair cache before building the scene")
+    parser.add_argument(
+        "--ribcache", nargs="?", const="rib_cache", default=None,
+        help="write every yarn layer to a content hashed RIB archive in this directory and ReadArchive it on later runs (no value: ./rib_cache)"
+    )
+    parser.add_argument("--clearribcache", action="count", help="empty the rib cache before building the scene")
+
+    parser.add_argument(
+        "--buffers", choices=["auto", "buffers", "lists"], default="auto",
+        help="hand geometry to Ri as float32/int32 buffers or as python lists, auto tries buffers first"
+    )
+    parser.add_argument("--verbose", action="count", help="print per primitive copy statistics")
+
     parser.add_argument("--rib", "-r", action="count", help="render to rib not framebuffer")
+    parser.add_argument(
+        "--ribformat", choices=["ascii", "binary"], default="ascii",
+        help="encoding of --rib output and of the archives written by --ribcache and --deferred, default ascii"
+    )
+    parser.add_argument("--ribgzip", action="count", help="gzip compress --rib output and the archives")
+    parser.add_argument(
+        "--stream", nargs="?", const="prman", default=None,
+        help="stream the scene as RIB (in --ribformat) into the stdin of a separately launched renderer command instead of rendering in this process, e.g. \"python rib_sink.py\" to measure throughput (no value: prman)"
+    )
+    parser.add_argument("--streamwait", action="count", help="wait for the --stream renderer to finish before exiting")
     parser.add_argument("--default", "-d", action="count", help="use PxrDefault")
     parser.add_argument("--vcm", "-v", action="count", help="use PxrVCM")
     parser.add_argument("--direct", "-t", action="count", help="use PxrDirect")
@@ -682,6 +557,8 @@ if __name__ == "__main__":
     parser.add_argument("--st", "-u", action="count", help="use PxrVisualizer with wireframe and ST")
 
     args = parser.parse_args()
+    if prman is None and not (args.stream or args.rib or args.archivesonly):
+        parser.error("prman is not importable, only --rib, --stream and --archivesonly work without RenderMan")
 
     shadingrate = args.shadingrate if args.shadingrate is not None else 1.0
     pixelvar = args.pixelvar if args.pixelvar is not None else 0.01
@@ -689,10 +566,62 @@ if __name__ == "__main__":
     width = args.width if args.width is not None else 1024
     height = args.height if args.height is not None else 720
 
-    if args.rib:
+    if args.rib and not args.stream:
         filename = "domelight2.rib"
     else:
         filename = "__render"
+    if args.archivesonly:
+        # the scene itself goes to the null device, only the archives are kept
+        args.deferred = args.deferred or "archives"
+        args.stream = None
+        filename = os.devnull
+
+    stream = None
+    if args.stream:
+        # command, binary encoding, wait for the renderer
+        stream = (args.stream, args.ribformat == "binary", bool(args.streamwait))
+
+    hair_cache = None
+    if args.haircache:
+        hair_cache = HairCache(args.haircache, args.haircachemb, args.haircompact)
+        if args.clearhaircache:
+            hair_cache.clear()
+
+    rib_cache = None
+    if args.ribcache:
+        rib_cache = RibCache(args.ribcache)
+        if args.clearribcache:
+            rib_cache.clear()
+
+    build_opts = {
+        "hairchunk": args.hairchunk,
+        "workers": args.workers,
+        "hair_cache": hair_cache,
+        "rib_cache": rib_cache,
+        "rib_binary": args.ribformat == "binary",
+        "rib_gzip": bool(args.ribgzip),
+        "buffers": args.buffers,
+        "verbose": bool(args.verbose),
+        "sampling": args.rootsampling,
+        "hairfraction": args.hairfraction,
+        "buried": bool(args.buried),
+        "hidden": args.hidden,
+        "cull": args.cull,
+        "dofthin": args.dofthin,
+        "lod": None if args.nolod else dict(
+            LOD_DEFAULTS, density=args.lod,
+            min_hairs=args.lodhairs[0], max_hairs=args.lodhairs[1],
+            min_points=args.lodpoints[0], max_points=args.lodpoints[1]),
+        "simplify": args.simplify,
+        "curls": args.curls,
+        "instances": args.hairinstances,
+        "patch_hairs": args.patchhairs,
+        "torus_buckets": args.torusbuckets,
+        "deferred": args.deferred,
+        "hairbudget": args.hairbudget,
+        "pipeline": args.pipeline,
+        "shared_shading": bool(args.sharedshading),
+    }
 
     integratorParams = {}
     integrator = "PxrPathTracer"
@@ -712,4 +641,5 @@ if __name__ == "__main__":
         integrator = "PxrVisualizer"
         integratorParams = {"int wireframe": [1], "string style": ["st"]}
 
-    main(filename, args.shadingrate, args.pixelvar, args.fov, args.width, args.height, integrator, integratorParams)
+    main(filename, args.shadingrate, args.pixelvar, args.fov, args.width, args.height, integrator, integratorParams,
+         build_opts, stream)
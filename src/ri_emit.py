@@ -0,0 +1,103 @@
+import collections
+
+import numpy as np
+
+
+# a python list of floats/ints costs a pointer plus a boxed number per element
+LIST_BYTES_PER_ITEM = 8 + 24
+
+LIST_CHUNK = 1 << 16
+
+
+def chunked_list(array, chunk=LIST_CHUNK):
+    # convert a flat array to a list a chunk at a time, so the temporary copies
+    # never hold more than one chunk next to the finished list
+    array = np.asarray(array).reshape(-1)
+    out = [0] * len(array)
+    for start in range(0, len(array), chunk):
+        out[start:start + chunk] = array[start:start + chunk].tolist()
+    return out
+
+
+class BufferEmitter:
+    # hands geometry to the Ri binding as contiguous float32/int32 buffers when the
+    # binding takes them, otherwise as lists built in chunks. mode "auto" tries
+    # buffers on the first primitive and falls back to lists if the binding raises
+    # TypeError, "buffers" and "lists" force one path. Every primitive records how
+    # many bytes had to be copied to get there.
+    def __init__(self, ri, mode="auto", verbose=False):
+        self.ri = ri
+        self.mode = mode
+        self.verbose = verbose
+        self.accepts_buffers = {"auto": None, "buffers": True, "lists": False}[mode]
+        self.totals = collections.defaultdict(lambda: [0, 0, 0]) # primitives, passed, copied
+
+    def _buffer(self, values, dtype):
+        # contiguous array of the requested type, plus bytes copied to make it
+        array = np.asarray(values)
+        if array.dtype == dtype and array.flags.c_contiguous:
+            return array.reshape(-1), 0
+        array = np.ascontiguousarray(array, dtype=dtype).reshape(-1)
+        return array, array.nbytes
+
+    def _call(self, kind, fn, args, params):
+        # args/params hold (array, dtype) pairs for the buffer arguments
+        use_buffers = self.accepts_buffers is not False
+        converted_args, converted_params, copied, passed = [], {}, 0, 0
+
+        for value in args:
+            if isinstance(value, tuple):
+                array, nbytes = self._buffer(*value)
+                copied += nbytes
+                passed += array.nbytes
+                value = array
+            converted_args.append(value)
+        for name, value in params.items():
+            array, nbytes = self._buffer(*value)
+            copied += nbytes
+            passed += array.nbytes
+            converted_params[name] = array
+
+        if use_buffers:
+            try:
+                fn(*converted_args, converted_params)
+                self.accepts_buffers = True
+                self._record(kind, passed, copied)
+                return
+            except TypeError:
+                if self.accepts_buffers:
+                    raise
+                self.accepts_buffers = False
+
+        # list fallback, every element ends up boxed in a python list
+        lists_args = [chunked_list(v) if isinstance(v, np.ndarray) else v for v in converted_args]
+        lists_params = {k: chunked_list(v) for k, v in converted_params.items()}
+        items = sum(len(v) for v in lists_args if isinstance(v, list))
+        items += sum(len(v) for v in lists_params.values())
+        fn(*lists_args, lists_params)
+        self._record(kind, passed, copied + items * LIST_BYTES_PER_ITEM)
+
+    def _record(self, kind, passed, copied):
+        totals = self.totals[kind]
+        totals[0] += 1
+        totals[1] += passed
+        totals[2] += copied
+        if self.verbose:
+            print("{}: {} bytes of buffers, {} bytes copied".format(kind, passed, copied))
+
+    def curves(self, nvertices, P, width, basis="cubic", wrap="nonperiodic"):
+        self._call("Curves", self.ri.Curves,
+                   [basis, (nvertices, np.int32), wrap],
+                   {self.ri.P: (P, np.float32), "float width": (width, np.float32)})
+
+    def polygon(self, params):
+        self._call("Polygon", self.ri.Polygon, [],
+                   {name: (value, np.float32) for name, value in params.items()})
+
+    def report(self):
+        lines = []
+        for kind, (count, passed, copied) in sorted(self.totals.items()):
+            lines.append("{}: {} primitives, {:.1f} MB passed, {:.1f} MB copied ({})".format(
+                kind, count, passed / (1024 * 1024), copied / (1024 * 1024),
+                "buffers" if self.accepts_buffers else "lists"))
+        return "\n".join(lines)
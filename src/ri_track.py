@@ -0,0 +1,169 @@
+import collections
+import math
+
+import numpy as np
+
+from yarn_layer import rotation_matrix
+
+
+class Camera:
+    # what the scene script told RenderMan about the camera, in RenderMan conventions:
+    # camera space looks down +z, matrices are row vector (p' = p . M)
+    def __init__(self):
+        self.world_to_camera = np.identity(4)
+        self.fov = 90.0
+        self.width = 640
+        self.height = 480
+        self.dof = None # (fstop, focallength, focaldistance) once DepthOfField is called
+
+    def screen_window(self):
+        # RenderMan fits the fov to the shorter side of the image
+        aspect = self.width / float(self.height)
+        return (aspect, 1.0) if aspect >= 1 else (1.0, 1.0 / aspect)
+
+    def position(self, object_to_world):
+        # camera position in the object space of object_to_world
+        camera_to_object = np.linalg.inv(object_to_world @ self.world_to_camera)
+        return camera_to_object[3, :3]
+
+    def to_camera(self, points, object_to_world):
+        m = object_to_world @ self.world_to_camera
+        return np.asarray(points, dtype=np.float64).reshape(-1, 3) @ m[:3, :3] + m[3, :3]
+
+    def in_frustum(self, cam_points, margin=0.0, radius=0.0):
+        # spheres (camera space centres, radius) touching the view frustum, margin widens
+        # the screen window by that fraction for things seen only in reflections
+        sx, sy = self.screen_window()
+        t = math.tan(math.radians(self.fov) / 2)
+        x, y, z = cam_points[:, 0], cam_points[:, 1], cam_points[:, 2]
+        radius = np.broadcast_to(radius, z.shape)
+
+        inside = z + radius > 0
+        for s, c in ((sx * t * (1 + margin), x), (sy * t * (1 + margin), y)):
+            # distance of the centre to the two side planes |c| = s z, normal (1, -s)
+            norm = math.sqrt(1 + s * s)
+            inside &= (c - s * z) / norm < radius
+            inside &= (-c - s * z) / norm < radius
+        return inside
+
+    def pixels_per_unit(self, depth):
+        # screen pixels covered by one unit of length at camera space depth
+        t = math.tan(math.radians(self.fov) / 2)
+        return min(self.width, self.height) / (2 * t * np.maximum(depth, 1e-9))
+
+    def coc_pixels(self, depth):
+        # circle of confusion diameter in pixels at camera space depth, thin lens with
+        # aperture focallength / fstop, zero without DepthOfField
+        depth = np.asarray(depth, dtype=np.float64)
+        if self.dof is None:
+            return np.zeros_like(depth)
+        fstop, focallength, focaldistance = self.dof
+        aperture = focallength / fstop
+        return aperture * np.abs(depth - focaldistance) / focaldistance * self.pixels_per_unit(depth)
+
+
+class TrackedRi:
+    # pass-through wrapper around prman.Ri that mirrors the transform stack and the
+    # camera setup in python, so the scene builder can work out where things end up
+    # on screen, and counts the shading nodes it is handed. Every call still goes to
+    # the real Ri unchanged.
+    def __init__(self, ri):
+        self._ri = ri
+        self._stack = []
+        self.ctm = np.identity(4) # current object to world (camera before WorldBegin)
+        self.camera = Camera()
+        self.shading_nodes = collections.Counter() # (request, type, handle, params) -> times emitted
+
+    def __getattr__(self, name):
+        return getattr(self._ri, name)
+
+    def fork(self, ri):
+        # tracker around another Ri (e.g. a RibWriter) starting from this transform and camera
+        other = TrackedRi(ri)
+        other.ctm = self.ctm.copy()
+        other.camera = self.camera
+        other.shading_nodes = self.shading_nodes
+        return other
+
+    def _concat(self, m):
+        self.ctm = m @ self.ctm
+
+    def TransformBegin(self):
+        self._stack.append(self.ctm)
+        self._ri.TransformBegin()
+
+    def TransformEnd(self):
+        self.ctm = self._stack.pop()
+        self._ri.TransformEnd()
+
+    def AttributeBegin(self):
+        self._stack.append(self.ctm)
+        self._ri.AttributeBegin()
+
+    def AttributeEnd(self):
+        self.ctm = self._stack.pop()
+        self._ri.AttributeEnd()
+
+    def Identity(self):
+        self.ctm = np.identity(4)
+        self._ri.Identity()
+
+    def Translate(self, x, y, z):
+        m = np.identity(4)
+        m[3, :3] = (x, y, z)
+        self._concat(m)
+        self._ri.Translate(x, y, z)
+
+    def Rotate(self, angle, x, y, z):
+        self._concat(rotation_matrix(angle, x, y, z))
+        self._ri.Rotate(angle, x, y, z)
+
+    def Scale(self, x, y, z):
+        self._concat(np.diag((x, y, z, 1.0)))
+        self._ri.Scale(x, y, z)
+
+    def ConcatTransform(self, m):
+        self._concat(np.asarray(m, dtype=np.float64).reshape(4, 4))
+        self._ri.ConcatTransform(m)
+
+    def Transform(self, m):
+        self.ctm = np.asarray(m, dtype=np.float64).reshape(4, 4)
+        self._ri.Transform(m)
+
+    def Projection(self, name, params={}):
+        if name == self._ri.PERSPECTIVE:
+            self.camera.fov = float(np.ravel(params.get(self._ri.FOV, [90.0]))[0])
+        self._ri.Projection(name, params)
+
+    def Format(self, width, height, aspect):
+        self.camera.width, self.camera.height = width, height
+        self._ri.Format(width, height, aspect)
+
+    def DepthOfField(self, fstop, focallength, focaldistance):
+        self.camera.dof = (fstop, focallength, focaldistance)
+        self._ri.DepthOfField(fstop, focallength, focaldistance)
+
+    def _shading_node(self, request, name, handle, params):
+        self.shading_nodes[(request, name, handle, repr(sorted(params.items())))] += 1
+
+    def Pattern(self, name, handle, params={}):
+        self._shading_node("Pattern", name, handle, params)
+        self._ri.Pattern(name, handle, params)
+
+    def Bxdf(self, name, handle, params={}):
+        self._shading_node("Bxdf", name, handle, params)
+        self._ri.Bxdf(name, handle, params)
+
+    def Displace(self, name, handle, params={}):
+        self._shading_node("Displace", name, handle, params)
+        self._ri.Displace(name, handle, params)
+
+    def shading_report(self):
+        return "shading nodes: {} emitted, {} unique".format(
+            sum(self.shading_nodes.values()), len(self.shading_nodes))
+
+    def WorldBegin(self):
+        # the transform at WorldBegin becomes the camera transform, world starts at identity
+        self.camera.world_to_camera = self.ctm
+        self.ctm = np.identity(4)
+        self._ri.WorldBegin()
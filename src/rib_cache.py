@@ -0,0 +1,76 @@
+import contextlib
+import hashlib
+import json
+import os
+import uuid
+
+
+# bump this whenever the RIB written for a layer changes for the same inputs
+RIB_CACHE_VERSION = 1
+
+
+def _plain(value):
+    # json friendly description of layer dicts, functions go by name
+    if callable(value):
+        return value.__name__
+    if isinstance(value, dict):
+        return {str(k): _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return value
+
+
+def content_key(parts):
+    desc = {"version": RIB_CACHE_VERSION, "parts": _plain(parts)}
+    return hashlib.sha1(json.dumps(desc, sort_keys=True).encode()).hexdigest()
+
+
+class RibCache:
+    # content addressed RIB archives of whole yarn layers. The key hashes everything
+    # that decides what a layer emits, a run that finds the archive only references
+    # it with ReadArchive instead of generating and serialising the layer again
+    def __init__(self, root):
+        self.root = root
+        self.hits = 0
+        self.misses = 0
+        self.written = 0
+        self.reused = 0
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, parts):
+        return content_key(parts)
+
+    def path(self, key):
+        return os.path.join(self.root, key + ".rib")
+
+    def lookup(self, key):
+        path = self.path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.reused += os.path.getsize(path)
+        return path
+
+    @contextlib.contextmanager
+    def writer(self, key):
+        # path to write the archive to, renamed into place only once complete
+        tmp = os.path.join(self.root, ".tmp-{}.rib".format(uuid.uuid4().hex))
+        try:
+            yield tmp
+            self.written += os.path.getsize(tmp)
+            os.replace(tmp, self.path(key))
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def clear(self):
+        for name in os.listdir(self.root):
+            if name.endswith(".rib"):
+                os.remove(os.path.join(self.root, name))
+
+    def report(self):
+        return "rib cache {}: {} hits, {} misses, {:.1f} MB written, {:.1f} MB reused".format(
+            self.root, self.hits, self.misses, self.written / (1024 * 1024), self.reused / (1024 * 1024))
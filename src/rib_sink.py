@@ -0,0 +1,31 @@
+import argparse
+import sys
+import time
+
+
+# dummy RIB consumer for --stream: reads the scene from stdin and reports how fast it
+# arrived, to measure the stream throughput without RenderMan installed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read a RIB stream from stdin and report its throughput")
+    parser.add_argument(
+        "--chunk", nargs="?", const=1 << 20, default=1 << 20, type=int,
+        help="bytes per read, default 1 MB"
+    )
+    args = parser.parse_args()
+
+    stream = sys.stdin.buffer
+    total = reads = 0
+    first = None
+    while True:
+        data = stream.read1(args.chunk)
+        if not data:
+            break
+        if first is None:
+            first = time.time()
+        total += len(data)
+        reads += 1
+
+    seconds = time.time() - first if first is not None else 0.0
+    print("rib sink: {:.1f} MB in {} reads over {:.2f}s from the first byte ({:.1f} MB/s)".format(
+        total / (1024 * 1024), reads, seconds, total / (1024 * 1024) / max(seconds, 1e-9)))
@@ -0,0 +1,49 @@
+import shlex
+import subprocess
+import time
+
+from rib_writer import RibWriter
+
+
+class _CountingPipe:
+    # write end of the pipe, counting what goes through
+    def __init__(self, f):
+        self.f = f
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+        return self.f.write(data)
+
+    def close(self):
+        self.f.close()
+
+
+class RibStream(RibWriter):
+    # stands in for prman.Ri and streams the scene as RIB into the stdin of a separately
+    # launched consumer, prman itself or rib_sink.py. The renderer parses the scene while
+    # it is still being built, and it runs in its own process (and session), so python
+    # can exit as soon as the last request is written and a crash on this side only cuts
+    # the stream short. Begin starts the consumer, End closes the pipe and leaves the
+    # consumer running unless wait is set
+    def __init__(self, command, binary=False, wait=False):
+        super().__init__(None, binary)
+        self.command = command
+        self.wait = wait
+        self.process = None
+
+    def Begin(self, name=None):
+        self.process = subprocess.Popen(shlex.split(self.command), stdin=subprocess.PIPE,
+                                        start_new_session=True)
+        self.f = _CountingPipe(self.process.stdin)
+        self.start = time.time()
+
+    def End(self):
+        # EOF ends the RIB for the consumer
+        self.f.close()
+        seconds = time.time() - self.start
+        print("streamed {:.1f} MB of {} RIB in {:.2f}s ({:.1f} MB/s) to {} (pid {})".format(
+            self.f.written / (1024 * 1024), "binary" if self.binary else "ascii", seconds,
+            self.f.written / (1024 * 1024) / max(seconds, 1e-9), self.command, self.process.pid))
+        if self.wait:
+            self.process.wait()
@@ -0,0 +1,225 @@
+import contextlib
+import gzip
+import io
+import os
+import struct
+import time
+
+import numpy as np
+
+
+# declaration types whose values are always floats in binary RIB
+FLOAT_TYPES = ("float", "point", "hpoint", "color", "normal", "vector", "matrix")
+
+
+def _format_value(value):
+    if isinstance(value, str):
+        return '"{}"'.format(value)
+    if isinstance(value, (bool, int, np.integer)):
+        return str(int(value))
+    return "{:.9g}".format(value)
+
+
+class RibWriter:
+    # stands in for prman.Ri and writes every call as a RIB request to a binary file
+    # object, so the scene builder can draw into archives with the same code it draws
+    # into the renderer with. Positional arguments become RIB arguments, a trailing
+    # dict becomes the parameter list, numpy arrays are written straight from the
+    # buffer. binary selects the binary RIB encoding instead of ASCII
+    P = "P"
+    FOV = "fov"
+    PERSPECTIVE = "perspective"
+    Proc2DelayedReadArchive = "DelayedReadArchive"
+    SimpleBound = "SimpleBound"
+    FLOAT_BLOCK = 1 << 16 # floats converted to big endian at a time by the binary encoding
+
+    def __init__(self, f, binary=False):
+        self.f = f
+        self.binary = binary
+        self._requests = {} # binary request codes defined so far
+        # numpy can only print arrays straight into a plain file (a gzip file has a
+        # fileno too, but writing to it would bypass the compression)
+        self._plain_file = type(f) is io.BufferedWriter
+
+    def __getattr__(self, name):
+        def request(*args):
+            params = {}
+            if args and isinstance(args[-1], dict):
+                args, params = args[:-1], args[-1]
+            if self.binary:
+                self._binary_request(name, args, params)
+            else:
+                self._ascii_request(name, args, params)
+        return request
+
+    # ASCII RIB
+
+    def _ascii_array(self, array):
+        array = np.asarray(array).reshape(-1)
+        fmt = "%d" if array.dtype.kind in "iu" else "%.9g"
+        self.f.write(b"[")
+        if self._plain_file:
+            self.f.flush()
+            array.tofile(self.f, sep=" ", format=fmt)
+        else:
+            self.f.write(" ".join(fmt % v for v in array.tolist()).encode())
+        self.f.write(b"]")
+
+    def _ascii_arg(self, value):
+        if isinstance(value, (list, tuple, np.ndarray)):
+            if isinstance(value, np.ndarray) or not all(isinstance(v, str) for v in value):
+                self._ascii_array(value)
+            else:
+                self.f.write(("[" + " ".join(_format_value(v) for v in value) + "]").encode())
+        else:
+            self.f.write(_format_value(value).encode())
+
+    def _ascii_request(self, name, args, params):
+        self.f.write(name.encode())
+        for value in args:
+            self.f.write(b" ")
+            self._ascii_arg(value)
+        for decl, value in params.items():
+            self.f.write(' "{}" '.format(decl).encode())
+            self._ascii_arg(value if isinstance(value, (list, tuple, np.ndarray)) else [value])
+        self.f.write(b"\n")
+
+    # binary RIB, see the RenderMan spec appendix on the binary encoding: 0x80+w
+    # integers, 0x90+n short strings, 0xa0+w long strings, 0xa4 floats, 0xa6 defined
+    # requests, 0xc8+w float arrays, 0xcc request definitions
+
+    def _binary_string(self, text):
+        data = text.encode()
+        if len(data) < 16:
+            return bytes([0x90 + len(data)]) + data
+        return b"\xa3" + struct.pack(">I", len(data)) + data
+
+    def _binary_ints(self, values):
+        values = np.asarray(values, dtype=np.int64).reshape(-1)
+        if len(values) == 0:
+            return b""
+        span = max(abs(int(values.min())), abs(int(values.max())))
+        width = 1 if span < 1 << 7 else 2 if span < 1 << 15 else 4
+        out = np.empty(len(values), dtype=[("code", "u1"), ("value", ">i{}".format(width))])
+        out["code"] = 0x80 + width - 1
+        out["value"] = values
+        return out.tobytes()
+
+    def _binary_floats(self, values):
+        # the header and the values, _binary_request writes the values a block at a time
+        values = np.asarray(values).reshape(-1)
+        return b"\xcb" + struct.pack(">I", len(values)), values
+
+    def _binary_arg(self, value, floats=False):
+        # floats forces number arrays to the float encoding, for float typed parameters.
+        # Bytes, or a (header, values) pair for a float array
+        if isinstance(value, str):
+            return self._binary_string(value)
+        if isinstance(value, (bool, int, np.integer)):
+            return self._binary_ints([value])
+        if isinstance(value, (list, tuple, np.ndarray)):
+            array = np.asarray(value)
+            if array.dtype.kind in "US":
+                return b"[" + b"".join(self._binary_string(str(v)) for v in value) + b"]"
+            if array.dtype.kind in "iub" and not floats:
+                return b"[" + self._binary_ints(array) + b"]"
+            return self._binary_floats(array)
+        return b"\xa4" + struct.pack(">f", value)
+
+    def _binary_request(self, name, args, params):
+        code = self._requests.get(name)
+        if code is None:
+            code = self._requests[name] = len(self._requests)
+            self.f.write(b"\xcc" + bytes([code]) + self._binary_string(name))
+        parts = [b"\xa6", bytes([code])]
+        parts.extend(self._binary_arg(value) for value in args)
+        for decl, value in params.items():
+            # float typed declarations force the float encoding, untyped ones ("camera",
+            # "endofframe") go by the values like the ASCII writer does
+            kind = decl.split()[-2].split("[")[0] if len(decl.split()) > 1 else ""
+            parts.append(self._binary_string(decl))
+            parts.append(self._binary_arg(value if isinstance(value, (list, tuple, np.ndarray)) else [value],
+                                          floats=kind in FLOAT_TYPES))
+        # small parts go out together, big float arrays (the hair) in blocks so that no
+        # big endian copy of the whole array is made
+        pending = []
+        for part in parts:
+            if isinstance(part, tuple):
+                header, values = part
+                pending.append(header)
+                if len(values) <= self.FLOAT_BLOCK:
+                    pending.append(values.astype(">f4").tobytes())
+                    continue
+                self.f.write(b"".join(pending))
+                pending = []
+                for start in range(0, len(values), self.FLOAT_BLOCK):
+                    self.f.write(values[start:start + self.FLOAT_BLOCK].astype(">f4").tobytes())
+            else:
+                pending.append(part)
+        self.f.write(b"".join(pending))
+
+
+@contextlib.contextmanager
+def open_rib(path, binary=False, compress=False):
+    # RibWriter on a new file, gzip compressed when compress is set
+    f = gzip.open(path, "wb", compresslevel=6) if compress else open(path, "wb")
+    try:
+        yield RibWriter(f, binary)
+    finally:
+        f.close()
+
+
+class RibFile(RibWriter):
+    # stands in for prman.Ri for a scene that is only written, never rendered in this
+    # process: Begin opens the named file (gzip compressed when compress is set) and End
+    # closes it. offset is the position in the RIB, before compression
+    def __init__(self, binary=False, compress=False):
+        super().__init__(None, binary)
+        self.compress = compress
+
+    def Begin(self, name):
+        self.f = gzip.open(name, "wb", compresslevel=6) if self.compress else open(name, "wb")
+        self._plain_file = type(self.f) is io.BufferedWriter
+
+    def End(self):
+        self.f.close()
+
+    def offset(self):
+        return self.f.tell()
+
+
+class RibStats:
+    # bytes on disk and seconds spent serialising, per named section of RIB output
+    def __init__(self):
+        self.sections = {}
+        self.offsets = {} # first and last byte of the sections of one file, see record_section
+
+    def record(self, name, nbytes, seconds):
+        entry = self.sections.setdefault(name, [0, 0.0, 0])
+        entry[0] += nbytes
+        entry[1] += seconds
+        entry[2] += 1
+
+    def record_section(self, name, start, end, seconds):
+        # a section of a bigger RIB file, from byte start up to end
+        self.record(name, end - start, seconds)
+        first, last = self.offsets.get(name, (start, end))
+        self.offsets[name] = (min(first, start), max(last, end))
+
+    @contextlib.contextmanager
+    def measure(self, name, path):
+        # times the block and records the size of path once it is written
+        start = time.time()
+        yield
+        self.record(name, os.path.getsize(path), time.time() - start)
+
+    def report(self, encoding):
+        lines = []
+        for name, (nbytes, seconds, count) in self.sections.items():
+            if name in self.offsets:
+                where = "bytes {} to {}".format(*self.offsets[name])
+            else:
+                where = "{} files".format(count)
+            lines.append("rib {}: {}, {:.1f} MB in {:.2f}s ({})".format(
+                name, where, nbytes / (1024 * 1024), seconds, encoding))
+        return "\n".join(lines)
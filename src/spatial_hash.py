@@ -0,0 +1,60 @@
+import itertools
+
+import numpy as np
+
+
+# offsets of a cell and its 26 neighbours
+NEIGHBOURS = np.array(list(itertools.product((-1, 0, 1), repeat=3)), dtype=np.int64)
+
+_BIAS = 1 << 20 # keeps cell coordinates positive before packing, 21 bits per axis
+
+
+def cell_keys(cells):
+    # pack integer (x, y, z) cell coordinates into one int64 key
+    c = cells + _BIAS
+    return (c[..., 0] << 42) | (c[..., 1] << 21) | c[..., 2]
+
+
+class HashGrid:
+    # uniform grid over 3d points stored as sorted cell keys, lookups are
+    # vectorised binary searches so whole query batches run without python loops
+    def __init__(self, points, cell_size):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        self.cell_size = cell_size
+        keys = cell_keys(self.cells(self.points))
+        self.order = np.argsort(keys, kind="stable")
+        self.keys = keys[self.order]
+
+    def cells(self, points):
+        return np.floor(points / self.cell_size).astype(np.int64)
+
+    def candidates(self, queries, reach=1):
+        # (query index, point index) pairs for every point in the cells within
+        # reach cells of each query, reach=1 covers distances up to cell_size
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, 3)
+        if reach == 1:
+            offsets = NEIGHBOURS
+        else:
+            r = range(-reach, reach + 1)
+            offsets = np.array(list(itertools.product(r, r, r)), dtype=np.int64)
+
+        qcells = self.cells(queries)
+        keys = cell_keys(qcells[:, None, :] + offsets[None, :, :]).reshape(-1)
+        lo = np.searchsorted(self.keys, keys, side="left")
+        hi = np.searchsorted(self.keys, keys, side="right")
+        counts = hi - lo
+
+        qi = np.repeat(np.repeat(np.arange(len(queries)), len(offsets)), counts)
+        # position inside each run of equal keys
+        starts = np.repeat(lo - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+        pj = self.order[np.arange(counts.sum()) + starts]
+        return qi, pj
+
+    def pairs_within(self, queries, radius):
+        # (query index, point index) pairs closer than radius
+        reach = max(1, int(np.ceil(radius / self.cell_size)))
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, 3)
+        qi, pj = self.candidates(queries, reach)
+        d = queries[qi] - self.points[pj]
+        close = np.einsum("ij,ij->i", d, d) < radius * radius
+        return qi[close], pj[close]
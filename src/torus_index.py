@@ -0,0 +1,86 @@
+import math
+
+import numpy as np
+
+from spatial_hash import HashGrid
+
+
+BATCH = 1 << 14
+
+
+class TorusIndex:
+    # spatial index over the transformed tori of one layer. The tori of a layer share
+    # (almost) one centre, so bounding volumes are useless, instead every torus
+    # centre circle is sampled about once per tube radius and the samples go into a
+    # hash grid. A point can only be inside torus j if it lies within the tube radius
+    # (plus half a sample spacing) of one of j's centre circle samples.
+    def __init__(self, matrices, majors, minors):
+        self.matrices = np.asarray(matrices, dtype=np.float64) # (N, 4, 4) object to layer
+        self.majors = np.asarray(majors, dtype=np.float64)
+        self.minors = np.broadcast_to(np.asarray(minors, dtype=np.float64), self.majors.shape)
+
+        spacing = self.minors.min()
+        gap = 0.0 # widest arc between two samples of any circle
+        samples, owners = [], []
+        for i, (m, major) in enumerate(zip(self.matrices, self.majors)):
+            n = max(8, int(math.ceil(2 * math.pi * major / spacing)))
+            a = np.linspace(0, 2 * math.pi, n, endpoint=False)
+            circle = np.stack((major * np.cos(a), major * np.sin(a), np.zeros(n), np.ones(n)), axis=1)
+            samples.append((circle @ m)[:, :3])
+            owners.append(np.full(n, i))
+            gap = max(gap, 2 * math.pi * major / n)
+
+        self.owners = np.concatenate(owners)
+        self.reach = self.minors.max() + gap / 2
+        self.grid = HashGrid(np.concatenate(samples), self.reach)
+
+    def inside(self, points, exclude=-1):
+        # True for every point strictly inside any torus of the index, except torus exclude
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        result = np.zeros(len(points), dtype=bool)
+
+        for start in range(0, len(points), BATCH):
+            batch = points[start:start + BATCH]
+            qi, sj = self.grid.pairs_within(batch, self.reach)
+            tj = self.owners[sj]
+
+            # one exact test per (point, torus) pair
+            pairs = np.unique(np.stack((qi, tj), axis=1), axis=0)
+            pairs = pairs[pairs[:, 1] != exclude]
+            if not len(pairs):
+                continue
+            qi, tj = pairs[:, 0], pairs[:, 1]
+
+            # back into the torus frame, the rotation part is orthonormal so its
+            # inverse is the transpose
+            m = self.matrices[tj]
+            local = np.einsum("ij,ikj->ik", batch[qi] - m[:, 3, :3], m[:, :3, :3])
+            ring = np.hypot(local[:, 0], local[:, 1]) - self.majors[tj]
+            hit = ring * ring + local[:, 2] * local[:, 2] < self.minors[tj] ** 2
+
+            result[start + qi[hit]] = True
+
+        return result
+
+
+def buried_strands(index, i, strands, matrix):
+    # the strands of torus i minus those whose root sits inside a neighbouring torus and
+    # whose tip ends inside the layer as well, those strands can never be seen.
+    # strands is (P, nvertices, width) in torus space (or None), returns it with the count rejected
+    if strands is None or len(strands[1]) == 0:
+        return strands, 0
+    P, nvertices, width = strands
+    count = len(nvertices)
+
+    # every strand of a torus has the same number of control points
+    curves = np.asarray(P, dtype=np.float64).reshape(count, -1, 3)
+    ends = curves[:, [0, -1]].reshape(-1, 3) @ matrix[:3, :3] + matrix[3, :3]
+    roots, tips = ends[0::2], ends[1::2]
+
+    buried = index.inside(roots, exclude=i)
+    buried[buried] = index.inside(tips[buried])
+
+    keep = ~buried
+    return ((np.ascontiguousarray(curves[keep], dtype=np.float32).reshape(-1), nvertices[keep], width[keep]),
+            int(buried.sum()))
+
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import math
+import os
+
+import numpy as np
+
+from hair_cache import HIDDEN_PREFIX
+
+
+def torus_surface_samples(matrix, major, minor, nu=48, nv=12, offset=0.0):
+    # grid of points and normals on one transformed torus, pushed offset along the
+    # normal (e.g. by the displacement bound) so the estimate errs on the visible side
+    u = np.linspace(0, 2 * math.pi, nu, endpoint=False)[:, None]
+    v = np.linspace(0, 2 * math.pi, nv, endpoint=False)[None, :]
+    normals = np.stack(np.broadcast_arrays(np.cos(u) * np.cos(v), np.sin(u) * np.cos(v), np.sin(v)), axis=-1)
+    centre = np.stack(np.broadcast_arrays(major * np.cos(u), major * np.sin(u), 0 * v), axis=-1)
+    points = (centre + normals * (minor + offset)).reshape(-1, 3)
+    normals = normals.reshape(-1, 3)
+    return points @ matrix[:3, :3] + matrix[3, :3], normals @ matrix[:3, :3]
+
+
+def hidden_tori(camera, layer_to_world, matrices, majors, minor, occluders, ball_radius,
+                offset=0.0, nu=48, nv=12, margin=0.1):
+    # True for every torus of a layer the camera cannot see: a grid of camera facing
+    # surface samples per torus is marched towards the camera in steps of half a tube
+    # radius, a ray dies when it enters any torus of occluders (a TorusIndex over the
+    # whole ball) and the torus is visible as soon as one ray leaves the ball while
+    # inside the (margin widened) view frustum. Hair is ignored as an occluder.
+    cam = camera.position(layer_to_world)
+
+    origins, owners = [], []
+    for i, (m, major) in enumerate(zip(matrices, majors)):
+        points, normals = torus_surface_samples(m, major, minor, nu, nv, offset)
+        facing = np.einsum("ij,ij->i", cam - points, normals) > 0
+        origins.append(points[facing])
+        owners.append(np.full(int(facing.sum()), i))
+    origins = np.concatenate(origins)
+    owners = np.concatenate(owners)
+
+    in_view = camera.in_frustum(camera.to_camera(origins, layer_to_world), margin)
+    origins, owners = origins[in_view], owners[in_view]
+
+    dirs = cam - origins
+    dist = np.linalg.norm(dirs, axis=1)
+    dirs /= dist[:, None]
+
+    # distance along each ray until it leaves the ball's bounding sphere (centred on
+    # the layer origin), past that nothing of the ball can block it
+    b = np.einsum("ij,ij->i", origins, dirs)
+    c = np.einsum("ij,ij->i", origins, origins) - ball_radius * ball_radius
+    exit_t = -b + np.sqrt(np.maximum(b * b - c, 0.0))
+
+    visible = np.zeros(len(matrices), dtype=bool)
+    step = minor / 2
+    t = step
+    live = np.arange(len(origins))
+    while len(live):
+        live = live[~visible[owners[live]]]
+        escaped = exit_t[live] < t
+        visible[owners[live[escaped]]] = True
+        live = live[~escaped]
+        if not len(live):
+            break
+
+        points = origins[live] + dirs[live] * t
+        live = live[~occluders.inside(points)]
+        t += step
+
+    return ~visible
+
+
+def camera_scale(camera, layer_to_world):
+    # largest factor a length in layer space is stretched by on its way to camera space
+    m = (layer_to_world @ camera.world_to_camera)[:3, :3]
+    return float(np.max(np.linalg.norm(m, axis=1)))
+
+
+def tori_in_view(camera, layer_to_world, matrices, radii, margin=0.1):
+    # True for every torus whose bounding sphere (radius around the torus centre, in
+    # layer units) touches the margin widened view frustum
+    centres = camera.to_camera(np.asarray(matrices)[:, 3, :3], layer_to_world)
+    return camera.in_frustum(centres, margin, np.asarray(radii) * camera_scale(camera, layer_to_world))
+
+
+def strands_in_view(camera, layer_to_world, matrix, P, count, width, occluder_radius, margin=0.1):
+    # True for every strand of one torus that can end up on screen. A cubic curve stays
+    # inside the convex hull of its control points, so a strand is dropped when the
+    # bounding sphere of its control points misses the frustum, or when every control
+    # point is hidden behind the opaque core of the ball, a sphere of occluder_radius
+    # around the layer origin (sphere plus its shadow is convex, so the hull is too)
+    curves = np.asarray(P, dtype=np.float64).reshape(count, -1, 3) @ matrix[:3, :3] + matrix[3, :3]
+
+    centre = curves.mean(axis=1)
+    radius = np.sqrt(np.max(np.sum((curves - centre[:, None]) ** 2, axis=2), axis=1)) + width
+    keep = camera.in_frustum(camera.to_camera(centre, layer_to_world), margin,
+                             radius * camera_scale(camera, layer_to_world))
+
+    # closest point of each control point to camera segment to the ball centre
+    d = camera.position(layer_to_world) - curves
+    t = np.clip(-np.einsum("ijk,ijk->ij", curves, d) / np.einsum("ijk,ijk->ij", d, d), 0.0, 1.0)
+    closest = curves + d * t[..., None]
+    shadowed = np.einsum("ijk,ijk->ij", closest, closest) < ((occluder_radius - width) ** 2)[:, None]
+    return keep & ~np.all(shadowed, axis=1)
+
+
+def cached_hidden(cache_dir, key_parts, compute):
+    # hidden torus flags for one scene build, stored as json in the hair cache root
+    # so a re-render with the same camera and layout skips the analysis. HairCache
+    # counts the files in its budget and evicts and clears them with the hair
+    if not cache_dir:
+        return compute()
+
+    key = hashlib.sha1(json.dumps(key_parts, sort_keys=True).encode()).hexdigest()
+    path = os.path.join(cache_dir, "{}{}.json".format(HIDDEN_PREFIX, key))
+    try:
+        with open(path) as f:
+            hidden = np.array(json.load(f), dtype=bool)
+        os.utime(path) # mark as recently used
+        return hidden
+    except (OSError, ValueError):
+        pass
+
+    hidden = compute()
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(hidden.tolist(), f)
+    return hidden
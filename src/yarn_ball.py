@@ -0,0 +1,67 @@
+import copy
+
+from ball_material import (MATERIAL_KEYS, material_structure, varying_params, attribute_layer,
+                           emit_attribute_patterns, user_attributes)
+from yarn_layer import emit_layer
+
+
+def layer_material(layer):
+    # the material part of a layer dict, what an instance can give each layer of the ball
+    return {key: layer[key] for key in MATERIAL_KEYS}
+
+
+class YarnBall:
+    # one yarn ball declared once as geometry with ObjectBegin and placed with
+    # ObjectInstance. layers is its (layer, emit_layer keyword arguments) list, the
+    # options only refer to layers of the list. materials maps an instance name to
+    # the material of every layer (see layer_material), which must have the material
+    # structure of the prototype layer: the float and color parameters that differ
+    # between the instances are set per instance as user attributes read back by
+    # PxrAttribute patterns declared once per layer. Every instance shares the
+    # geometry (torus count, radii, seeds, hair) of the prototype, its size comes
+    # from the transform it is placed with
+    def __init__(self, name, layers, materials):
+        self.name = name
+        self.layers = layers
+        self.materials = materials
+        for instance, material in materials.items():
+            for (layer, _), own in zip(layers, material):
+                if material_structure(own) != material_structure(layer):
+                    raise ValueError("{}: the {} material of {} sets other parameters, references or ints than "
+                                     "the prototype, only float and color values can differ per instance".format(
+                                         name, layer["name"], instance))
+        self.varying = [varying_params([layer] + [material[i] for material in materials.values()])
+                        for i, (layer, _) in enumerate(layers)]
+
+    def declare(self, build):
+        # view dependent pruning cannot hold for every placement, and object
+        # definitions do not nest (nor hold procedurals), so those options are off
+        # inside the prototype
+        ball_build = copy.copy(build)
+        ball_build.hidden = "off"
+        ball_build.cull = ball_build.dofthin = ball_build.lod = None
+        ball_build.instances = ball_build.torus_buckets = 0
+        ball_build.deferred = None
+
+        ri = build.ri
+        ri.ObjectBegin(self.name)
+        for i, (layer, options) in enumerate(self.layers):
+            layer = attribute_layer(layer, i, self.varying[i])
+            ri.AttributeBegin()
+            emit_attribute_patterns(ri, layer)
+            emit_layer(ball_build, layer, **options)
+            ri.AttributeEnd()
+        ri.ObjectEnd()
+
+        print("{}: one prototype for {}, {} material parameters per instance".format(
+            self.name, ", ".join(self.materials), sum(len(v) for v in self.varying)))
+
+    def instance(self, ri, name):
+        attributes = {}
+        for i, material in enumerate(self.materials[name]):
+            attributes.update(user_attributes(material, i, self.varying[i]))
+        ri.AttributeBegin()
+        if attributes:
+            ri.Attribute("user", attributes)
+        ri.ObjectInstance(self.name)
+        ri.AttributeEnd()
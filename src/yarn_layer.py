@@ -0,0 +1,813 @@
+import collections
+import copy
+import json
+import math
+import os
+import random
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from hair_engine import GENERATOR_VERSION
+from hair_pool import stream_layer_hair, hair_bytes, HairPipeline
+from ri_emit import BufferEmitter, LIST_BYTES_PER_ITEM
+from torus_index import TorusIndex, buried_strands
+from visibility import hidden_tori, cached_hidden, tori_in_view, strands_in_view
+from lod import dof_keep, thin_strands, screen_lod, lod_jobs
+from hair_simplify import simplify_strands
+from hair_instances import HairPatches
+from ball_material import emit_hair_bxdf
+from rib_writer import open_rib, RibStats
+from rib_cache import content_key
+
+
+# every torus is drawn with Scale(0.125) and Scale(.40510) on top of the layer transform,
+# emitted as one Scale by this product, which is exact as 0.125 is a power of two
+TORUS_SCALE = 0.40510 * .125
+
+# the numpy version of the wave (math.sin or math.cos) a layer picks for the z rotation
+RZ_WAVES = {math.sin: np.sin, math.cos: np.cos}
+
+
+def rotation_matrix(angle, x, y, z):
+    # same matrix ri.Rotate concatenates, RenderMan row vector convention (p' = p . M)
+    a = math.radians(angle)
+    c, s = math.cos(a), math.sin(a)
+    n = math.sqrt(x * x + y * y + z * z)
+    x, y, z = x / n, y / n, z / n
+
+    m = np.identity(4)
+    m[0, :3] = (c + x * x * (1 - c), x * y * (1 - c) + z * s, x * z * (1 - c) - y * s)
+    m[1, :3] = (x * y * (1 - c) - z * s, c + y * y * (1 - c), y * z * (1 - c) + x * s)
+    m[2, :3] = (x * z * (1 - c) + y * s, y * z * (1 - c) - x * s, c + z * z * (1 - c))
+    return m
+
+
+def rotation_matrices(angles, x, y, z):
+    # rotation_matrix for an array of angles about one axis, (N, 4, 4), the same
+    # expressions element by element so every matrix is bit for bit the same
+    a = np.radians(angles)
+    c, s = np.cos(a), np.sin(a)
+    n = math.sqrt(x * x + y * y + z * z)
+    x, y, z = x / n, y / n, z / n
+
+    m = np.zeros((len(a), 4, 4))
+    m[:, 0, :3] = np.stack((c + x * x * (1 - c), x * y * (1 - c) + z * s, x * z * (1 - c) - y * s), axis=-1)
+    m[:, 1, :3] = np.stack((x * y * (1 - c) - z * s, c + y * y * (1 - c), y * z * (1 - c) + x * s), axis=-1)
+    m[:, 2, :3] = np.stack((x * z * (1 - c) + y * s, y * z * (1 - c) - x * s, c + z * z * (1 - c)), axis=-1)
+    m[:, 3, 3] = 1
+    return m
+
+
+def torus_matrices(layout):
+    # (N, 4, 4) object to layer matrices of Translate(tx, ty, tz) Rotate(rx, X) Rotate(ry, Y)
+    # Rotate(rz, Z) for an (N, 7) layout, later Ri calls act first on the points so they
+    # come first in the row vector product
+    translate = np.zeros((len(layout), 4, 4))
+    translate[:] = np.identity(4)
+    translate[:, 3, :3] = layout[:, 3:6]
+    return (rotation_matrices(layout[:, 2], 0, 0, 1) @ rotation_matrices(layout[:, 1], 0, 1, 0)
+            @ rotation_matrices(layout[:, 0], 1, 0, 0) @ translate)
+
+
+def transform_points(P, matrix):
+    # bake a 4x4 row vector matrix into a flat xyz array, returns flat float32
+    pts = np.asarray(P, dtype=np.float64).reshape(-1, 3)
+    out = pts @ matrix[:3, :3] + matrix[3, :3]
+    return out.astype(np.float32).reshape(-1)
+
+
+class SceneBuild:
+    # the Ri instance plus everything that decides how the yarn layers are built,
+    # created once in main() from the command line options
+    def __init__(self, ri, hairchunk=0, workers=0, hair_cache=None, buffers="auto", verbose=False,
+                 sampling="uniform", hairfraction=1.0, buried=False, hidden="off", cull=None,
+                 dofthin=None, lod=None, simplify=None, curls=0, instances=0, patch_hairs=300,
+                 torus_buckets=0, ball_instances=False, deferred=None, rib_cache=None,
+                 rib_binary=False, rib_gzip=False, hairbudget=0, pipeline=0, shared_shading=False,
+                 scene_rib=None):
+        self.ri = ri
+        self.hairchunk = hairchunk # 0 one Curves per torus, N tori per Curves, -1 whole layer
+        self.workers = workers # hair process pool size, 0 none, -1 all cores
+        # one pool for the whole build, its processes start on the first hair job
+        self.pool = ProcessPoolExecutor(max_workers=workers if workers > 0 else os.cpu_count()) if workers else None
+        self.hair_cache = hair_cache # optional HairCache
+        self.emitter = BufferEmitter(ri, buffers, verbose)
+        self.sampling = sampling # hair root sampler, see hair_engine.ROOT_SAMPLERS
+        self.hairfraction = hairfraction # scales the hair count of every layer
+        self.buried = buried # drop hair rooted inside neighbouring tori of the same layer
+        self.hidden = hidden # "off", "drop" or "proxy" for tori the camera cannot see
+        self.cull = cull # None, or the frustum margin for culling tori and strands off screen
+        self.dofthin = dofthin # None, or the strength of hair thinning in depth of field blur
+        self.lod = lod # None, or screen space level of detail settings, see lod.LOD_DEFAULTS
+        self.simplify = simplify # None, or the world space tolerance for refitting strands
+        self.curls = curls # 0 walks every hair, N builds hair from N curl templates
+        self.instances = instances # 0 unique hair per torus, N instances N hair patches per layer
+        self.patch_hairs = patch_hairs # strands per instanced hair patch
+        self.torus_buckets = torus_buckets # 0 unique tori, N instances N torus prototypes per layer
+        self.ball_instances = ball_instances # instance one yarn ball prototype for every ball
+        self.deferred = deferred # None, or the directory of per torus DelayedReadArchive RIBs
+        self.rib_cache = rib_cache # optional RibCache of whole layers
+        self.rib_binary = rib_binary # binary instead of ASCII RIB, for --rib output and archives
+        self.rib_gzip = rib_gzip # gzip compressed RIB, for --rib output and archives
+        self.hairbudget = hairbudget # 0 whole layers at once, otherwise MB of hair arrays alive at a time (a soft budget)
+        self.pipeline = pipeline # 0 grow then emit, N grow ahead in a thread through a queue of N pieces
+        self.shared_shading = shared_shading # one torus material and one hair Bxdf per layer, not per torus
+        self.scene_rib = scene_rib # None, or the RibFile of --rib, every layer is recorded as a section of it
+        self.rib_stats = RibStats()
+        if deferred:
+            # every torus group is its own archive, so nothing is merged or instanced across tori
+            self.hairchunk = self.instances = self.torus_buckets = 0
+
+    def report(self):
+        print(self.emitter.report())
+        print(self.ri.shading_report())
+        if self.hair_cache is not None:
+            print(self.hair_cache.report())
+        if self.rib_cache is not None:
+            print(self.rib_cache.report())
+        if self.rib_stats.sections:
+            print(self.rib_stats.report(self.rib_encoding()))
+        if self.hairbudget:
+            # ru_maxrss is in kilobytes on linux and in bytes on macOS
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1 << (20 if sys.platform == "darwin" else 10))
+            # the budget only covers the hair arrays, the interpreter, numpy, the pool
+            # and the Ri binding come on top
+            print("peak RSS {:.0f} MB with hair streamed in {} MB chunks".format(peak, self.hairbudget))
+
+    def hair_budget(self):
+        # bytes of float32 hair alive at once under hairbudget, 0 for no limit. Unless the
+        # binding is known to take buffers every element may also become a boxed list item
+        if not self.hairbudget:
+            return 0
+        budget = self.hairbudget * 1024 * 1024
+        if self.emitter.accepts_buffers is not True:
+            budget *= 4 / (4 + LIST_BYTES_PER_ITEM)
+        return max(int(budget), 1)
+
+    def stream_budget(self, jobs):
+        # hair_budget, but a pipeline without a cap grows about one torus per worker at
+        # a time so that emission can start early. No torus is over it, so nothing is split
+        budget = self.hair_budget()
+        if self.pipeline and not budget:
+            sizes = [hair_bytes(job) for job in jobs if job is not None]
+            budget = max(sizes, default=0) * max(1, self.workers if self.workers > 0 else os.cpu_count())
+        return budget
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def rib_encoding(self):
+        return ("binary" if self.rib_binary else "ascii") + (" gzip" if self.rib_gzip else "")
+
+    def record_rib(self, filename, seconds):
+        # the whole scene RIB, timed from Begin to End, the layers in it are sections
+        if not os.path.exists(filename):
+            return
+        self.rib_stats.record("scene " + filename, os.path.getsize(filename), seconds)
+        print(self.rib_stats.report(self.rib_encoding()).splitlines()[-1])
+
+
+class ArrayBuffer:
+    # a flat array filled piece by piece and emptied again, allocated once at capacity
+    # (only the pages written to take memory) and grown by doubling when a piece does
+    # not fit
+    def __init__(self, dtype, capacity=0):
+        self.array = np.empty(capacity, dtype)
+        self.size = 0
+
+    def append(self, n):
+        # the next n elements to write into
+        if self.size + n > len(self.array):
+            grown = np.empty(max(self.size + n, 2 * len(self.array)), self.array.dtype)
+            grown[:self.size] = self.array[:self.size]
+            self.array = grown
+        self.size += n
+        return self.array[self.size - n:self.size]
+
+    def values(self):
+        return self.array[:self.size]
+
+
+class HairBatch:
+    # collects already transformed hair from several tori of one layer and emits it
+    # as a single Curves primitive with one hair Bxdf, chunk = number of tori per
+    # primitive, chunk < 0 merges the whole layer. The hair is written straight into
+    # buffers that are reused for every primitive. Under a hair budget the buffers
+    # are sized to it and a primitive is flushed before a piece would take it over
+    TRANSFORM_BLOCK = 1 << 16 # points transformed at a time, bounds the float64 temporaries
+
+    def __init__(self, build, layer, chunk=-1):
+        self.ri = build.ri
+        self.emitter = build.emitter
+        self.layer = layer
+        self.chunk = chunk
+        self.bxdf = not build.shared_shading # shared shading sets the hair Bxdf around the layer
+        self.budget = build.hair_budget()
+        self.primitives = 0
+        self._P = ArrayBuffer(np.float32, self.budget // 4)
+        self._nvertices = ArrayBuffer(np.int32, self.budget // 4)
+        self._width = ArrayBuffer(np.float32, self.budget // 4)
+        self._pieces = 0
+
+    def _size(self):
+        return self._P.size * 4 + self._nvertices.size * 4 + self._width.size * 4
+
+    def add(self, matrix, P, nvertices, width):
+        pts = np.asarray(P).reshape(-1, 3)
+        size = pts.size * 4 + len(nvertices) * 4 + len(width) * 4
+        if self.budget and self._pieces and self._size() + size > self.budget:
+            self.flush()
+
+        # transform_points into the buffer, a block at a time
+        out = self._P.append(pts.size).reshape(-1, 3)
+        for start in range(0, len(pts), self.TRANSFORM_BLOCK):
+            block = pts[start:start + self.TRANSFORM_BLOCK].astype(np.float64)
+            out[start:start + self.TRANSFORM_BLOCK] = block @ matrix[:3, :3] + matrix[3, :3]
+        self._nvertices.append(len(nvertices))[:] = nvertices
+        self._width.append(len(width))[:] = width
+        self._pieces += 1
+        if self.chunk > 0 and self._pieces >= self.chunk:
+            self.flush()
+
+    def flush(self):
+        if not self._pieces:
+            return
+        if self.bxdf:
+            self.ri.AttributeBegin()
+            emit_hair_bxdf(self.ri, self.layer)
+        self.emitter.curves(self._nvertices.values(), self._P.values(), self._width.values())
+        if self.bxdf:
+            self.ri.AttributeEnd()
+        self.primitives += 1
+        self._P.size = self._nvertices.size = self._width.size = self._pieces = 0
+
+
+class StrandFilter:
+    # the per strand options (buried, cull, dofthin, simplify) applied to one piece of
+    # a torus's hair at a time as it streams past, counting what each of them removed.
+    # The camera and layer transform are taken when it is made, pieces are filtered
+    # while the Ri transform stack is inside a torus
+    def __init__(self, build, layer, layout, matrices, core=None):
+        self.build = build
+        self.camera = build.ri.camera
+        self.layer_to_world = build.ri.ctm.copy()
+        self.layer = layer
+        self.counts = collections.Counter()
+
+        self.index = None
+        if build.buried:
+            self.index = TorusIndex(matrices, layout[:, 6] * TORUS_SCALE, layer["rmin"] * TORUS_SCALE)
+        # the innermost tori of the core layer make the ball opaque
+        self.occluder_radius = min((core or layer)["rmaj"]) * TORUS_SCALE
+        self.dofthin = build.dofthin if self.camera.dof is not None else None
+        self.tolerance = None
+        if build.simplify is not None:
+            # the tolerance is in world space, the strands are in (rigidly placed) torus space
+            self.tolerance = build.simplify / np.max(np.linalg.norm(self.layer_to_world[:3, :3], axis=1))
+
+    def __call__(self, i, matrix, strands):
+        if strands is None:
+            return None
+        camera, layer_to_world, counts = self.camera, self.layer_to_world, self.counts
+
+        if self.index is not None:
+            strands, rejected = buried_strands(self.index, i, strands, matrix)
+            counts["buried"] += rejected
+
+        if self.build.cull is not None and len(strands[1]):
+            P, nvertices, width = strands
+            keep = strands_in_view(camera, layer_to_world, matrix, P, len(nvertices), width,
+                                   self.occluder_radius, self.build.cull)
+            counts["strands"] += len(keep)
+            counts["culled"] += len(keep) - int(keep.sum())
+            if not keep.all():
+                P = np.asarray(P).reshape(len(nvertices), -1)[keep].reshape(-1)
+                strands = (P, nvertices[keep], width[keep])
+
+        if self.dofthin is not None and len(strands[1]):
+            keep = dof_keep(camera, layer_to_world, matrix, strands[0], len(strands[1]), self.dofthin)
+            counts["blurred"] += len(strands[1])
+            strands = thin_strands(strands, keep)
+            counts["thinned"] += len(strands[1])
+
+        if self.tolerance is not None:
+            counts["points"] += int(np.sum(strands[1]))
+            strands = simplify_strands(*strands, self.tolerance)
+            counts["simplified"] += int(np.sum(strands[1]))
+
+        return strands
+
+    def report(self, jobs, visible, in_view):
+        name, counts = self.layer["name"], self.counts
+        if self.index is not None:
+            print("{}: rejected {} of {} hair roots buried in neighbouring tori".format(
+                name, counts["buried"], sum(job["count"] for job in jobs if job is not None)))
+        if self.build.cull is not None:
+            print("{}: culled {} of {} tori outside the view, {} of {} strands off screen or behind the ball".format(
+                name, int((visible & ~in_view).sum()), int(visible.sum()), counts["culled"], counts["strands"]))
+        if self.dofthin is not None:
+            print("{}: depth of field thinning kept {} of {} strands, {} saved".format(
+                name, counts["thinned"], counts["blurred"], counts["blurred"] - counts["thinned"]))
+        if self.tolerance is not None:
+            print("{}: simplified hair from {} to {} control points".format(
+                name, counts["points"], counts["simplified"]))
+
+
+def emit_torus_material(ri, layer, displace=True):
+    if displace:
+        ri.Attribute("displacementbound", {"float sphere": [0.02]}) # .2
+        ri.Attribute("dice", {
+            "float micropolygonlength": [0.1]
+        })
+
+        ri.Pattern("disp", "disp", layer["disp"])
+
+        ri.Displace(
+            "PxrDisplace", "pxrdisp",
+            {"reference float dispScalar": ["disp:resultF"]}
+        )
+
+    # colour spiral pattern to simulate strands of fibres
+    ri.Pattern("spiralColourNoise", "spiralColourNoise", layer["colour"])
+    ri.Pattern("spiralSpecNoise", "spiralSpecNoise", layer["spec"])
+
+    ri.Bxdf("PxrSurface", "yarnShader", layer["surface"])
+
+
+def layer_layout(layer):
+    # (N, 7) array of rx, ry, rz, tx, ty, tz, rmaj per torus of the layer: non repeating
+    # rotations and tiny offsets from irrational constants + trig + jitter, and a random
+    # major radius. The jitter is the stream of random.uniform calls the per torus loop
+    # used to make (7 per torus, seeded with the layer seed), a + (b - a) * random(), so
+    # the layout is bit for bit the same
+    random.seed(layer["seed"]) # makes randomness repeatable across runs
+    n = layer["num_tori"]
+    lo = np.array([-10, -10, -10, -0.00005, -0.00005, -0.00005, layer["rmaj"][0]])
+    hi = np.array([10, 10, 10, 0.00005, 0.00005, 0.00005, layer["rmaj"][1]])
+    jitter = lo + (hi - lo) * np.array([random.random() for _ in range(7 * n)]).reshape(n, 7)
+
+    i = np.arange(n)
+    rz_wave = RZ_WAVES[layer["rz_wave"]]
+    layout = np.stack((
+        np.sin(i * 1.618) * 180,
+        np.cos(i * 2.718) * 180,
+        rz_wave(i * 3.1415) * 180,
+        np.sin(i * 0.06) * 0.0001,
+        np.cos(i * 0.06) * 0.0001,
+        np.sin(i * 0.06) * 0.0001,
+        np.zeros(n),
+    ), axis=1)
+    return layout + jitter
+
+
+def hair_jobs(build, layer, layout):
+    # generate_hair_arrays arguments per torus, radii match the effective torus radii
+    jobs = [{
+        "count": int(round(layer["hair_count"] * build.hairfraction)),
+        "major_radius": rmaj * TORUS_SCALE,
+        "minor_radius": layer["rmin"] * TORUS_SCALE,
+        "hair_length": layer["hair_length"],
+        "hair_width": layer["hair_width"],
+        "num_control_points": 10,
+        "sampling": build.sampling,
+    } for rmaj in layout[:, 6].tolist()]
+    if build.curls:
+        # only set when used, so walked hair keeps its hair cache keys
+        for job in jobs:
+            job["curls"] = build.curls
+    return jobs
+
+
+def find_hidden(build, layer, layout, matrices, covered_by):
+    # flags the tori of layer the camera cannot see past the rest of the ball
+    # (this layer plus the covered_by layers), cached next to the hair cache
+    ball = [(layer, layout, matrices)]
+    for other in covered_by:
+        other_layout = layer_layout(other)
+        ball.append((other, other_layout, torus_matrices(other_layout)))
+
+    all_matrices = np.concatenate([m for _, _, m in ball])
+    majors = np.concatenate([lo[:, 6] * TORUS_SCALE for _, lo, _ in ball])
+    minors = np.concatenate([[l["rmin"] * TORUS_SCALE] * len(lo) for l, lo, _ in ball])
+    ball_radius = float(np.max(np.linalg.norm(all_matrices[:, 3, :3], axis=1) + majors + minors))
+
+    # samples sit on the displaced surface plus one hair length, anything within reach
+    # of the fuzz of a torus counts as that torus being seen
+    minor = layer["rmin"] * TORUS_SCALE
+    offset = layer["disp"]["float scale1"][0] * TORUS_SCALE + layer["hair_length"]
+
+    camera = build.ri.camera
+    layer_to_world = build.ri.ctm
+
+    def compute():
+        occluders = TorusIndex(all_matrices, majors, minors)
+        return hidden_tori(camera, layer_to_world, matrices, majors[:len(layout)], minor,
+                           occluders, ball_radius, offset)
+
+    key_parts = {
+        "version": 1,
+        "camera": camera.world_to_camera.tolist(),
+        "view": [camera.fov, camera.width, camera.height],
+        "layer_to_world": layer_to_world.tolist(),
+        "layers": [[l["seed"], l["num_tori"], l["rmin"], list(l["rmaj"]), l["rz_wave"].__name__]
+                   for l, _, _ in ball],
+        "offset": offset,
+    }
+    cache_dir = build.hair_cache.root if build.hair_cache is not None else None
+    return cached_hidden(cache_dir, key_parts, compute)
+
+
+def emit_core_proxy(ri, layer, hidden_rmajs, visible_rmajs=()):
+    # one undisplaced sphere in the yarn material filling the space of the pruned tori,
+    # so nothing can be seen through the gaps they leave. It stays inside the innermost
+    # visible torus, so it never cuts into or swallows one that is still drawn
+    radius = max(hidden_rmajs) - layer["rmin"]
+    if len(visible_rmajs):
+        radius = min(radius, min(visible_rmajs) - layer["rmin"])
+    ri.AttributeBegin()
+    emit_torus_material(ri, layer, displace=False)
+    ri.Scale(TORUS_SCALE, TORUS_SCALE, TORUS_SCALE)
+    ri.Sphere(radius, -radius, radius, 360)
+    ri.AttributeEnd()
+
+
+def quantize_radii(layer, layout, buckets):
+    # snaps every major radius of the layout to the centre of one of buckets even
+    # bins over the layer's rmaj range, returns the new layout, the bucket per torus,
+    # the bucket radii and the largest radius change
+    lo, hi = layer["rmaj"]
+    centres = lo + (np.arange(buckets) + 0.5) * (hi - lo) / buckets
+    rmajs = layout[:, 6]
+    index = np.clip(((rmajs - lo) / (hi - lo) * buckets).astype(int), 0, buckets - 1)
+    quantized = layout.copy()
+    quantized[:, 6] = centres[index]
+    return quantized, index, centres, float(np.max(np.abs(centres[index] - rmajs)))
+
+
+def declare_torus_prototypes(ri, layer, radii):
+    # one displaced, shaded torus per major radius, declared with ObjectBegin
+    handles = []
+    for i, rmaj in enumerate(radii):
+        handle = "{}Torus{}".format(layer["name"].replace(" ", ""), i)
+        ri.ObjectBegin(handle)
+        ri.AttributeBegin()
+        emit_torus_material(ri, layer)
+        ri.Scale(TORUS_SCALE, TORUS_SCALE, TORUS_SCALE)
+        ri.Torus(rmaj, layer["rmin"], 0, 360, 360)
+        ri.AttributeEnd()
+        ri.ObjectEnd()
+        handles.append(handle)
+    return handles
+
+
+def torus_transform_begin(ri, matrix):
+    # the whole placement of one torus as a single ConcatTransform
+    ri.TransformBegin()
+    ri.ConcatTransform(matrix.reshape(-1).tolist())
+
+
+def emit_torus(ri, layer, rmaj, material=True):
+    # material False leaves the shading to an enclosing attribute block
+    ri.AttributeBegin()
+    if material:
+        emit_torus_material(ri, layer)
+
+    # DISPLACED TORUS
+    ri.Scale(TORUS_SCALE, TORUS_SCALE, TORUS_SCALE)
+    ri.Torus(rmaj, layer["rmin"], 0, 360, 360)
+    ri.AttributeEnd()
+
+
+def emit_hair(ri, emitter, layer, strands, bxdf=True):
+    P, nvertices, width = strands
+    ri.AttributeBegin()
+    if bxdf:
+        emit_hair_bxdf(ri, layer)
+
+    # based on the lecture example on hair, these parameters are the minimum needed in the rib
+    emitter.curves(nvertices, P, width)
+    ri.AttributeEnd()
+
+
+def hair_extent(strands):
+    # lowest and highest corner of the control points of strands, None without hair
+    if strands is None or not len(strands[1]):
+        return None
+    P = np.asarray(strands[0]).reshape(-1, 3)
+    return P.min(axis=0), P.max(axis=0)
+
+
+def torus_bound(layer, rmaj, extents=()):
+    # [xmin xmax ymin ymax zmin zmax] around a torus and the hair_extent of its hair
+    # pieces in the rotated torus space, the displacement bound included
+    outer = (rmaj + layer["rmin"] + 0.02) * TORUS_SCALE
+    tube = (layer["rmin"] + 0.02) * TORUS_SCALE
+    lo, hi = np.array([-outer, -outer, -tube]), np.array([outer, outer, tube])
+    for extent in extents:
+        if extent is not None:
+            lo, hi = np.minimum(lo, extent[0]), np.maximum(hi, extent[1])
+    return [float(v) for pair in zip(lo, hi) for v in pair]
+
+
+def torus_archive_path(build, layer, index):
+    return os.path.join(build.deferred, "{}_{:04d}.rib".format(layer["name"].replace(" ", "_"), index))
+
+
+def find_torus_archive(path, key):
+    # the bound of the archive at path when it was written for key, else None. The
+    # key and bound sit in a json file next to the archive, written once it is complete
+    try:
+        with open(path + ".json") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if entry.get("key") != key or not os.path.exists(path):
+        return None
+    return entry["bound"]
+
+
+def write_torus_archive(build, layer, index, rmaj, pieces, key):
+    # one torus and its hair as a RIB archive for DelayedReadArchive, returns the
+    # path and the bound to hand to Procedural2. The hair pieces are written one
+    # at a time, only their extents are kept for the bound
+    os.makedirs(build.deferred, exist_ok=True)
+    path = torus_archive_path(build, layer, index)
+    extents = []
+    with build.rib_stats.measure(layer["name"] + " archives", path):
+        with open_rib(path, build.rib_binary, build.rib_gzip) as rib:
+            writer = build.ri.fork(rib)
+            emit_torus(writer, layer, rmaj)
+            emitter = BufferEmitter(writer, "buffers")
+            for strands in pieces:
+                if strands is not None:
+                    emit_hair(writer, emitter, layer, strands)
+                    extents.append(hair_extent(strands))
+    bound = torus_bound(layer, rmaj, extents)
+    with open(path + ".json", "w") as f:
+        json.dump({"key": key, "bound": bound}, f)
+    return path, bound
+
+
+def torus_reach(layer, rmaj):
+    # bounding sphere radius of a torus in layer units, displacement bound and the
+    # longest possible hair (2.5 x hair_length, see grow_hair) included
+    return (rmaj + layer["rmin"] + 0.02) * TORUS_SCALE + 2.5 * layer["hair_length"]
+
+
+# SceneBuild options that change what a layer emits
+EMIT_OPTIONS = ("hairchunk", "sampling", "hairfraction", "buried", "hidden", "cull", "dofthin", "lod",
+                "simplify", "curls", "instances", "patch_hairs", "torus_buckets", "deferred", "hairbudget",
+                "shared_shading")
+
+# options whose result depends on the camera and where the layer sits, level of
+# detail only changes the hair jobs and enters the keys through them
+VIEW_OPTIONS = ("hidden", "cull", "dofthin")
+
+
+def layer_hair_jobs(build, layer, layout, matrices):
+    # hair job per torus, with the screen space level of detail applied when it is on.
+    # The density is scaled by hairfraction like the hair counts, so an explicit
+    # fraction above 1 is not capped back to the density
+    jobs = hair_jobs(build, layer, layout)
+    if build.lod is not None:
+        hairs, points = screen_lod(build.ri.camera, build.ri.ctm, matrices, layout[:, 6] * TORUS_SCALE,
+                                   layer["rmin"] * TORUS_SCALE, layer["hair_length"], build.lod)
+        jobs = lod_jobs(jobs, hairs * build.hairfraction, points, build.lod)
+    return jobs
+
+
+def layer_key_parts(build, layer, covered_by, core, jobs=None):
+    # what decides the content of a layer, for the rib cache and the deferred
+    # archives. jobs are the level of detail hair jobs of the layer, a camera move
+    # that leaves them as they are keeps the key. The deferred archives leave them
+    # out, every torus key holds its own job
+    parts = {
+        "generator": GENERATOR_VERSION,
+        "layer": layer,
+        "covered_by": list(covered_by),
+        "core": core,
+        "options": {name: getattr(build, name) for name in EMIT_OPTIONS},
+        "encoding": build.rib_encoding(),
+        # hair read back from a compact hair cache is quantized
+        "hair_compact": build.hair_cache.compact_bits if build.hair_cache is not None else 0,
+    }
+    if any(getattr(build, name) not in (None, "off") for name in VIEW_OPTIONS):
+        camera = build.ri.camera
+        parts["view"] = [camera.world_to_camera, build.ri.ctm, camera.fov, camera.width,
+                         camera.height, camera.dof]
+    elif jobs is not None:
+        parts["hair_jobs"] = jobs
+    return parts
+
+
+def lod_key_jobs(build, layer):
+    # the hair jobs emit_layer would grow for layer under level of detail, None without it
+    if build.lod is None:
+        return None
+    layout = layer_layout(layer)
+    matrices = torus_matrices(layout)
+    if build.torus_buckets:
+        layout = quantize_radii(layer, layout, build.torus_buckets)[0]
+    return layer_hair_jobs(build, layer, layout, matrices)
+
+
+def emit_cached_layer(build, layer, covered_by=(), core=None):
+    # emit_layer through the RIB cache: written to an archive on a miss, then
+    # referenced with ReadArchive
+    cache = build.rib_cache
+    key = cache.key(layer_key_parts(build, layer, covered_by, core, lod_key_jobs(build, layer)))
+    path = cache.lookup(key)
+    if path is None:
+        with cache.writer(key) as tmp:
+            with build.rib_stats.measure(layer["name"], tmp):
+                with open_rib(tmp, build.rib_binary, build.rib_gzip) as writer:
+                    archive_build = copy.copy(build)
+                    archive_build.rib_cache = None
+                    archive_build.ri = build.ri.fork(writer)
+                    archive_build.emitter = BufferEmitter(archive_build.ri, "buffers")
+                    emit_layer(archive_build, layer, covered_by, core)
+        path = cache.path(key)
+    else:
+        print("{}: read from the rib cache".format(layer["name"]))
+    build.ri.ReadArchive(path)
+
+
+def emit_scene_section(build, layer, covered_by=(), core=None):
+    # emit_layer into the --rib scene file, recording where the layer sits in it and
+    # how long it took
+    rib = build.scene_rib
+    start, began = rib.offset(), time.time()
+    section_build = copy.copy(build)
+    section_build.scene_rib = None
+    emit_layer(section_build, layer, covered_by, core)
+    build.rib_stats.record_section("scene " + layer["name"], start, rib.offset(), time.time() - began)
+
+
+def emit_layer(build, layer, covered_by=(), core=None):
+    # one layer of displaced tori with their fuzz, see SceneBuild for the options.
+    # covered_by lists the layers drawn over this one, used to find hidden tori,
+    # core is the layer whose innermost tori make the ball opaque (default this one)
+    if build.scene_rib is not None:
+        return emit_scene_section(build, layer, covered_by, core)
+    if build.rib_cache is not None:
+        return emit_cached_layer(build, layer, covered_by, core)
+
+    ri = build.ri
+    layout = layer_layout(layer)
+    matrices = torus_matrices(layout) # also used to bake in merged hair and for the culling bounds
+
+    prototypes = None
+    if build.torus_buckets:
+        # hair follows the quantized radius so it stays on the instanced surface
+        layout, bucket, radii, error = quantize_radii(layer, layout, build.torus_buckets)
+        prototypes = declare_torus_prototypes(ri, layer, radii)
+        print("{}: {} torus prototypes for {} tori, max major radius error {:.4f} ({:.0f}% of the tube radius)".format(
+            layer["name"], len(prototypes), len(layout), error, 100 * error / layer["rmin"]))
+
+    jobs = layer_hair_jobs(build, layer, layout, matrices)
+
+    if build.lod is not None:
+        full = sum(job["count"] for job in hair_jobs(build, layer, layout))
+        print("{}: level of detail {} of {} hairs, {} to {} control points".format(
+            layer["name"], sum(job["count"] for job in jobs), full,
+            min(job["num_control_points"] for job in jobs), max(job["num_control_points"] for job in jobs)))
+
+    in_view = np.ones(len(layout), dtype=bool)
+    if build.cull is not None:
+        in_view = tori_in_view(ri.camera, ri.ctm, matrices,
+                               torus_reach(layer, layout[:, 6]), build.cull)
+
+    visible = np.ones(len(layout), dtype=bool)
+    if build.hidden != "off" and covered_by:
+        visible = ~find_hidden(build, layer, layout, matrices, covered_by)
+        print("{}: {} of {} tori hidden from the camera, {}".format(
+            layer["name"], int((~visible).sum()), len(layout),
+            "replaced by a core proxy" if build.hidden == "proxy" else "dropped"))
+
+    drawn = visible & in_view
+    jobs = [job if d and not build.instances else None for job, d in zip(jobs, drawn)]
+
+    # deferred archives written for the same inputs by an earlier run are referenced
+    # as they are, their tori are not grown again
+    keys, archived = {}, {}
+    if build.deferred:
+        layer_key = content_key(layer_key_parts(build, layer, covered_by, core))
+        for i in np.flatnonzero(drawn).tolist():
+            keys[i] = content_key([layer_key, i, jobs[i]])
+            bound = find_torus_archive(torus_archive_path(build, layer, i), keys[i])
+            if bound is not None:
+                archived[i] = bound
+                jobs[i] = None
+        print("{}: {} of {} torus archives reused, {} written".format(
+            layer["name"], len(archived), len(keys), len(keys) - len(archived)))
+
+    patches = None
+    if build.instances:
+        patches = HairPatches(layer, int(round(layer["hair_count"] * build.hairfraction)),
+                              build.instances, build.patch_hairs, TORUS_SCALE)
+        patches.declare(ri, build.emitter)
+        print("{}: {} hair patches of {} strands, {} instances per torus, {} unique of {} strands".format(
+            layer["name"], patches.count, patches.hairs, patches.segments, patches.unique_hairs(),
+            patches.hairs * patches.segments * int(drawn.sum())))
+
+    batch = HairBatch(build, layer, build.hairchunk) if build.hairchunk and not patches else None
+    strand_filter = StrandFilter(build, layer, layout, matrices, core)
+
+    # hair is grown, filtered and emitted a few tori (or one piece of a torus) at a time,
+    # under a hair budget only about that much hair is alive at once
+    hair = stream_layer_hair(layer["seed"], jobs, build.stream_budget(jobs), build.pool, build.hair_cache)
+    hair = ((i, (strand_filter(i, matrices[i], strands) for strands in pieces)) for i, pieces in hair)
+    if build.pipeline:
+        # growing and filtering move to a producer thread, the Ri calls stay on this one
+        hair = pipeline = HairPipeline(hair, build.pipeline)
+
+    # shared shading declares the torus material once around all tori of the layer and
+    # the hair Bxdf once around all of its hair, which then follows in a second pass
+    # (so the hair never inherits the displacement). Prototypes and archives keep the
+    # material they were written with
+    shared = build.shared_shading and not build.deferred
+    if shared and prototypes is None:
+        ri.AttributeBegin()
+        emit_torus_material(ri, layer)
+
+    tori = ((i, ()) for i in range(len(layout))) if shared else hair
+    for (i, pieces), rmaj, matrix, d in zip(tori, layout[:, 6].tolist(), matrices, drawn):
+        if not d:
+            continue
+
+        torus_transform_begin(ri, matrix)
+
+        if build.deferred:
+            # prman reads the archive when a ray first reaches the bound
+            if i in archived:
+                path, bound = torus_archive_path(build, layer, i), archived[i]
+            else:
+                path, bound = write_torus_archive(build, layer, i, rmaj, pieces, keys[i])
+            ri.Procedural2(ri.Proc2DelayedReadArchive, ri.SimpleBound, {
+                "string filename": [path],
+                "float[6] bound": bound,
+            })
+        else:
+            if prototypes is not None:
+                ri.ObjectInstance(prototypes[bucket[i]])
+            else:
+                emit_torus(ri, layer, rmaj, material=not shared)
+
+            # YARN HAIR
+            if shared:
+                pass
+            elif patches is not None:
+                patches.instance(ri, rmaj)
+            elif batch is None:
+                for strands in pieces:
+                    emit_hair(ri, build.emitter, layer, strands)
+
+        ri.TransformEnd()
+
+        # merged hair carries the torus transform in its points, so it is added
+        # (and possibly flushed) outside the per torus transform
+        if batch is not None:
+            for strands in pieces:
+                batch.add(matrix, *strands)
+
+    if shared and prototypes is None:
+        ri.AttributeEnd()
+
+    if shared:
+        ri.AttributeBegin()
+        emit_hair_bxdf(ri, layer)
+        for (i, pieces), rmaj, matrix, d in zip(hair, layout[:, 6].tolist(), matrices, drawn):
+            if not d:
+                continue
+            if batch is not None:
+                for strands in pieces:
+                    batch.add(matrix, *strands)
+                continue
+            torus_transform_begin(ri, matrix)
+            if patches is not None:
+                patches.instance(ri, rmaj, bxdf=False)
+            else:
+                for strands in pieces:
+                    emit_hair(ri, build.emitter, layer, strands, bxdf=False)
+            ri.TransformEnd()
+        if batch is not None:
+            batch.flush()
+        ri.AttributeEnd()
+
+    if batch is not None:
+        batch.flush()
+        print("{}: {} tori, {} hair Curves primitives".format(
+            layer["name"], layer["num_tori"], batch.primitives))
+
+    strand_filter.report(jobs, visible, in_view)
+    if build.pipeline:
+        print("{}: {}".format(layer["name"], pipeline.report()))
+
+    if build.hidden == "proxy" and not visible.all():
+        emit_core_proxy(ri, layer, layout[~visible, 6].tolist(), layout[visible, 6].tolist())
@@ -0,0 +1,38 @@
+import copy
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from render_image_ONE import CORE_LAYER, TOP_LAYER
+from ri_track import TrackedRi
+from rib_writer import open_rib
+from yarn_layer import SceneBuild, emit_layer
+
+
+@pytest.fixture
+def small_layers():
+    # the image one layers cut down to a few tori
+    core, top = copy.deepcopy(CORE_LAYER), copy.deepcopy(TOP_LAYER)
+    core["num_tori"], top["num_tori"] = 12, 4
+    return core, top
+
+
+@pytest.fixture
+def layer_rib(tmp_path, small_layers):
+    # RIB bytes of the small layers emitted through RibWriter with SceneBuild options
+    def emit(name="scene", **options):
+        core, top = small_layers
+        path = str(tmp_path / (name + ".rib"))
+        with open_rib(path) as rib:
+            build = SceneBuild(TrackedRi(rib), **dict({"hairfraction": 0.05}, **options))
+            try:
+                emit_layer(build, core, covered_by=[top])
+                emit_layer(build, top, core=core)
+            finally:
+                build.close()
+        with open(path, "rb") as f:
+            return f.read()
+    return emit
@@ -0,0 +1,49 @@
+import io
+
+import numpy as np
+
+from ri_track import Camera, TrackedRi
+from rib_writer import RibWriter
+
+
+def camera(fov=90.0, width=640, height=480):
+    cam = Camera()
+    cam.fov, cam.width, cam.height = fov, width, height
+    return cam
+
+
+def test_in_frustum_follows_the_screen_window():
+    # 640x480 at 90 degrees sees |x| < 4/3 z and |y| < z
+    points = np.array([[0, 0, 5], [6.5, 0, 5], [7, 0, 5], [0, 4.9, 5], [0, 5.1, 5], [0, 0, -1]])
+    assert camera().in_frustum(points).tolist() == [True, True, False, True, False, False]
+
+
+def test_in_frustum_radius_and_margin():
+    cam = camera()
+    points = np.array([[0, 5.5, 5], [7, 0, 5], [0, 0, -1]])
+    assert cam.in_frustum(points, radius=1.5).tolist() == [True, True, True]
+    assert cam.in_frustum(points, margin=0.1).tolist() == [False, True, False]
+
+
+def test_tracked_camera_sees_through_the_world_transform():
+    ri = TrackedRi(RibWriter(io.BytesIO()))
+    ri.Format(640, 480, 1)
+    ri.Projection(ri.PERSPECTIVE, {ri.FOV: [90.0]})
+    ri.Translate(0, 0, 5)
+    ri.WorldBegin()
+    cam_points = ri.camera.to_camera([[0, 0, 0], [10, 0, 0]], ri.ctm)
+    assert np.allclose(cam_points, [[0, 0, 5], [10, 0, 5]])
+    assert ri.camera.in_frustum(cam_points).tolist() == [True, False]
+
+
+def test_coc_pixels_is_zero_without_depth_of_field():
+    assert np.array_equal(camera().coc_pixels([1.0, 5.0, 20.0]), [0, 0, 0])
+
+
+def test_coc_pixels_thin_lens():
+    cam = camera()
+    cam.dof = (2.0, 0.05, 5.0)
+    coc = cam.coc_pixels([2.5, 5.0, 10.0, 20.0])
+    # aperture 0.025 times |depth - 5| / 5 units, 480 / (2 depth) pixels per unit
+    assert np.allclose(coc, [0.025 * 0.5 * 96, 0, 0.025 * 24, 0.025 * 3 * 12])
+    assert coc[2] < coc[3]
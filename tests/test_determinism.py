@@ -0,0 +1,8 @@
+def test_workers_give_identical_rib(layer_rib):
+    serial = layer_rib("serial")
+    assert b"Curves" in serial
+    assert layer_rib("pool", workers=2) == serial
+
+
+def test_seeded_output_repeats(layer_rib):
+    assert layer_rib("first") == layer_rib("second")
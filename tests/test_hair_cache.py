@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+
+from hair_cache import HairCache
+from hair_engine import generate_hair_arrays
+from visibility import cached_hidden
+
+
+JOB = {"count": 50, "major_radius": 0.05, "minor_radius": 0.002, "hair_length": 0.001}
+
+
+def grow(seed):
+    return generate_hair_arrays(np.random.default_rng(seed), **JOB)
+
+
+def test_miss_then_hit(tmp_path):
+    cache = HairCache(str(tmp_path))
+    seed = np.random.SeedSequence(7).spawn(1)[0]
+    key = cache.key(seed, JOB)
+    assert cache.load(key) is None
+    hair = grow(seed)
+    cache.store(key, *hair)
+
+    loaded = cache.load(key)
+    assert (cache.hits, cache.misses) == (1, 1)
+    for a, b in zip(hair, loaded):
+        assert np.array_equal(a, b)
+
+
+def test_key_follows_seed_and_job(tmp_path):
+    cache = HairCache(str(tmp_path))
+    a, b = np.random.SeedSequence(7).spawn(2)
+    assert cache.key(a, JOB) == cache.key(np.random.SeedSequence(7).spawn(1)[0], JOB)
+    assert cache.key(a, JOB) != cache.key(b, JOB)
+    assert cache.key(a, JOB) != cache.key(a, dict(JOB, count=51))
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = HairCache(str(tmp_path), budget_mb=0.01)
+    seeds = np.random.SeedSequence(3).spawn(2)
+    keys = [cache.key(seed, JOB) for seed in seeds]
+    cache.store(keys[0], *grow(seeds[0]))
+    os.utime(os.path.join(str(tmp_path), keys[0]), (0, 0)) # clearly the older entry
+    cache.store(keys[1], *grow(seeds[1]))
+    assert cache.evictions == 1
+    assert cache.load(keys[0]) is None
+    assert cache.load(keys[1]) is not None
+
+
+def test_hidden_sets_are_counted_and_cleared(tmp_path):
+    root = str(tmp_path)
+    hidden = cached_hidden(root, {"layer": 1}, lambda: np.array([True, False, True]))
+    assert hidden.tolist() == [True, False, True]
+    assert cached_hidden(root, {"layer": 1}, lambda: None).tolist() == hidden.tolist()
+
+    cache = HairCache(root)
+    seed = np.random.SeedSequence(5).spawn(1)[0]
+    cache.store(cache.key(seed, JOB), *grow(seed))
+    assert cache._size == sum(size for _, size, _ in cache._entries())
+    assert len(cache._entries()) == 2
+    cache.clear()
+    assert os.listdir(root) == []
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from hair_compact import encode_hair, decode_hair, error_bound, write_compact, read_compact
+from hair_engine import generate_hair_arrays
+
+
+def torus_hair():
+    # one torus of the image one core layer
+    return generate_hair_arrays(np.random.default_rng(5), 400, major_radius=0.0557,
+                                minor_radius=0.00173, hair_length=0.0075 * .125, hair_width=2.7e-5)
+
+
+@pytest.mark.parametrize("bits", [16, 8])
+def test_round_trip_within_error_bound(tmp_path, bits):
+    P, nvertices, width = torus_hair()
+    path = str(tmp_path / "hair.yhc")
+    write_compact(path, encode_hair(P, nvertices, width, bits))
+    compact = read_compact(path)
+    P2, nvertices2, width2 = decode_hair(compact)
+
+    error = np.abs(P2.reshape(-1, 3).astype(np.float64) - P.reshape(-1, 3)).max(axis=0)
+    assert np.all(error <= error_bound(compact) * 1.001 + 1e-7)
+    assert np.array_equal(nvertices2, nvertices)
+    assert np.array_equal(width2, width)
+
+
+def test_sixteen_bit_error_below_hair_width():
+    P, nvertices, width = torus_hair()
+    assert error_bound(encode_hair(P, nvertices, width)).max() < width[0]
+
+
+def test_rejects_mixed_strands():
+    P, nvertices, width = torus_hair()
+    width = width.copy()
+    width[0] *= 2
+    with pytest.raises(ValueError):
+        encode_hair(P, nvertices, width)
@@ -0,0 +1,53 @@
+import math
+import random
+
+import numpy as np
+
+from hair_engine import (generate_hair, generate_hair_arrays, rng_from_random, curl_templates,
+                         curl_statistics, CURL_WINDOWS, sample_torus_area, sample_torus_blue_noise,
+                         poisson_radius)
+
+
+def test_list_wrapper_matches_arrays():
+    pts, widths, npts = [], [], []
+    random.seed(3)
+    generate_hair(pts, widths, npts, count=50, hair_width=0.002)
+
+    random.seed(3)
+    P, nvertices, width = generate_hair_arrays(rng_from_random(), 50, hair_width=0.002)
+    assert pts == P.tolist()
+    assert npts == [10] * 50
+    assert widths == width.tolist()
+
+
+def test_template_hair_keeps_the_walk_spacing():
+    # control point j of every strand sits j / 9 of the strand length from its root
+    rng = np.random.default_rng(4)
+    P, nvertices, width = generate_hair_arrays(rng, 300, hair_length=0.02, curls=256)
+    curves = P.reshape(300, 10, 3).astype(np.float64)
+    reach = np.linalg.norm(curves - curves[:, :1], axis=2)
+    assert np.allclose(reach / reach[:, -1:], np.linspace(0.0, 1.0, 10), atol=1e-5)
+    assert np.all((reach[:, -1] > 0.01 - 1e-6) & (reach[:, -1] < 0.05 + 1e-6))
+
+
+def test_template_windows_are_distinct_curls():
+    templates = curl_templates(16)
+    assert templates.shape == (16 * CURL_WINDOWS, 10, 3)
+    turning = curl_statistics(templates[:, 1:].astype(np.float64))[1]
+    assert len(np.unique(turning)) == len(turning)
+
+
+def test_area_sampler_follows_the_surface_area():
+    # the outer half of the tube (cos v > 0) holds 1/2 + r / (pi R) of the surface
+    roots, norms = sample_torus_area(np.random.default_rng(7), 1.0, 0.3, 20000)
+    outer = np.hypot(roots[:, 0], roots[:, 1]) > 1.0
+    assert abs(outer.mean() - (0.5 + 0.3 / math.pi)) < 0.02
+    assert np.allclose(np.linalg.norm(norms, axis=1), 1.0)
+
+
+def test_blue_noise_roots_keep_their_distance():
+    roots, _ = sample_torus_blue_noise(np.random.default_rng(8), 1.0, 0.3, 500)
+    assert len(roots) == 500
+    gaps = np.linalg.norm(roots[:, None] - roots[None, :], axis=2)
+    np.fill_diagonal(gaps, np.inf)
+    assert gaps.min() >= poisson_radius(1.0, 0.3, 500)
@@ -0,0 +1,27 @@
+import numpy as np
+
+from hair_engine import generate_hair_arrays
+from hair_simplify import bezier_basis, simplify_strands
+
+
+def test_simplified_strands_stay_within_tolerance():
+    count, tolerance = 300, 0.002
+    P, nvertices, width = generate_hair_arrays(np.random.default_rng(1), count, hair_length=0.02)
+    width = np.arange(count, dtype=np.float32) # tells the strands apart after the regrouping
+    sP, snvertices, swidth = simplify_strands(P, nvertices, width, tolerance)
+
+    assert sorted(swidth.tolist()) == width.tolist()
+    assert set(snvertices.tolist()) == {4, 7, 10}
+    assert np.all(np.diff(snvertices) >= 0) # grouped by vertex count, fewest first
+    assert len(sP) == 3 * snvertices.sum()
+
+    curves = P.reshape(count, 10, 3).astype(np.float64)
+    original = np.einsum("mv,cvd->cmd", bezier_basis(10), curves)
+    start = 0
+    for vertices, strand in zip(snvertices.tolist(), swidth.astype(int).tolist()):
+        fitted = sP[start:start + 3 * vertices].reshape(vertices, 3).astype(np.float64)
+        start += 3 * vertices
+        # root and tip are kept, the curve stays within the tolerance where it is measured
+        assert np.array_equal(fitted[[0, -1]], curves[strand, [0, -1]])
+        error = np.linalg.norm(bezier_basis(vertices) @ fitted - original[strand], axis=1)
+        assert error.max() <= tolerance + 1e-6
@@ -0,0 +1,59 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from render_image_ONE import CORE_LAYER, TOP_LAYER
+from yarn_layer import layer_layout, quantize_radii, rotation_matrix, torus_matrices
+
+
+def scalar_layout(layer):
+    # the per torus loop layer_layout replaced, one random.uniform call per value
+    random.seed(layer["seed"])
+    layout = []
+    for i in range(layer["num_tori"]):
+        rx = math.sin(i * 1.618) * 180 + random.uniform(-10, 10)
+        ry = math.cos(i * 2.718) * 180 + random.uniform(-10, 10)
+        rz = layer["rz_wave"](i * 3.1415) * 180 + random.uniform(-10, 10)
+        tx = math.sin(i * 0.06) * 0.0001 + random.uniform(-0.00005, 0.00005)
+        ty = math.cos(i * 0.06) * 0.0001 + random.uniform(-0.00005, 0.00005)
+        tz = math.sin(i * 0.06) * 0.0001 + random.uniform(-0.00005, 0.00005)
+        layout.append((rx, ry, rz, tx, ty, tz, random.uniform(*layer["rmaj"])))
+    return layout
+
+
+def scalar_matrix(rx, ry, rz, tx, ty, tz):
+    translate = np.identity(4)
+    translate[3, :3] = (tx, ty, tz)
+    return (rotation_matrix(rz, 0, 0, 1) @ rotation_matrix(ry, 0, 1, 0)
+            @ rotation_matrix(rx, 1, 0, 0) @ translate)
+
+
+@pytest.mark.parametrize("layer", [CORE_LAYER, TOP_LAYER], ids=lambda layer: layer["name"])
+def test_layout_is_bit_identical_to_the_loop(layer):
+    assert layer_layout(layer).tolist() == [list(row) for row in scalar_layout(layer)]
+
+
+@pytest.mark.parametrize("layer", [CORE_LAYER, TOP_LAYER], ids=lambda layer: layer["name"])
+def test_matrices_match_the_loop(layer):
+    layout = layer_layout(layer)
+    expected = np.array([scalar_matrix(*row[:6]) for row in layout])
+    assert np.array_equal(torus_matrices(layout), expected)
+
+
+def test_torus_buckets_snap_and_instance_the_radii(small_layers, layer_rib):
+    core, top = small_layers
+    layout = layer_layout(core)
+    quantized, bucket, radii, error = quantize_radii(core, layout, 4)
+    lo, hi = core["rmaj"]
+    assert np.array_equal(quantized[:, :6], layout[:, :6])
+    assert np.array_equal(quantized[:, 6], radii[bucket])
+    assert error == np.abs(quantized[:, 6] - layout[:, 6]).max() <= (hi - lo) / 8
+
+    # one torus per bucket and layer, every torus placed as the prototype of its bucket
+    rib = layer_rib("buckets", torus_buckets=4).decode()
+    assert rib.count("\nTorus ") == rib.count("ObjectBegin") == 8
+    instances = [line.split('"')[1] for line in rib.splitlines() if line.startswith("ObjectInstance")]
+    assert instances[:len(layout)] == ["{}Torus{}".format(core["name"].replace(" ", ""), i) for i in bucket]
+    assert len(instances) == core["num_tori"] + top["num_tori"]
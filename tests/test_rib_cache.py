@@ -0,0 +1,82 @@
+import io
+import os
+
+from hair_cache import HairCache
+from lod import LOD_DEFAULTS
+from rib_cache import RibCache
+from ri_track import TrackedRi
+from rib_writer import RibWriter
+from yarn_layer import SceneBuild, layer_key_parts, lod_key_jobs
+
+
+def test_lookup_miss_then_hit(tmp_path):
+    cache = RibCache(str(tmp_path / "cache"))
+    key = cache.key({"layer": {"seed": 3, "rz_wave": os.path.join}})
+    assert cache.lookup(key) is None
+    with cache.writer(key) as tmp:
+        with open(tmp, "w") as f:
+            f.write("Torus 1 0.2 0 360 360\n")
+    assert cache.lookup(key) == cache.path(key)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert not [name for name in os.listdir(cache.root) if name.startswith(".tmp-")]
+
+
+def test_failed_write_leaves_no_entry(tmp_path):
+    cache = RibCache(str(tmp_path / "cache"))
+    key = cache.key({"seed": 1})
+    try:
+        with cache.writer(key) as tmp:
+            open(tmp, "w").close()
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    assert os.listdir(cache.root) == []
+
+
+def test_key_covers_every_part(tmp_path):
+    cache = RibCache(str(tmp_path / "cache"))
+    assert cache.key({"seed": 1, "options": [1, 2]}) == cache.key({"options": [1, 2], "seed": 1})
+    assert cache.key({"seed": 1}) != cache.key({"seed": 2})
+
+
+def test_layers_are_read_back_on_the_second_run(tmp_path, layer_rib):
+    cache = RibCache(str(tmp_path / "cache"))
+    first = layer_rib("first", rib_cache=cache)
+    assert (cache.hits, cache.misses) == (0, 2)
+    assert layer_rib("second", rib_cache=cache) == first
+    assert (cache.hits, cache.misses) == (2, 2)
+    assert first.count(b"ReadArchive") == 2
+
+    # the archives hold what the layers emit without the cache
+    archives = b"".join(open(cache.path(name[:-4]), "rb").read()
+                        for name in sorted(os.listdir(cache.root), key=lambda n: first.index(n.encode())))
+    assert archives == layer_rib("direct")
+
+
+def test_compact_hair_cache_changes_the_key(tmp_path, layer_rib):
+    cache = RibCache(str(tmp_path / "cache"))
+    full = layer_rib("full", rib_cache=cache, hair_cache=HairCache(str(tmp_path / "hair")))
+    compact = layer_rib("compact", rib_cache=cache,
+                        hair_cache=HairCache(str(tmp_path / "hair16"), compact_bits=16))
+    assert (cache.hits, cache.misses) == (0, 4)
+    assert compact != full
+
+
+def lod_layer_key(cache, layer, distance, width=1920, height=1080):
+    # rib cache key of layer seen from distance with level of detail on
+    ri = TrackedRi(RibWriter(io.BytesIO()))
+    ri.Format(width, height, 1)
+    ri.Projection(ri.PERSPECTIVE, {ri.FOV: 48.0})
+    ri.Translate(0, 0, distance)
+    ri.WorldBegin()
+    build = SceneBuild(ri, hairfraction=0.05, lod=LOD_DEFAULTS)
+    return cache.key(layer_key_parts(build, layer, (), None, lod_key_jobs(build, layer)))
+
+
+def test_lod_key_follows_the_hair_jobs_not_the_camera(tmp_path, small_layers):
+    cache = RibCache(str(tmp_path / "cache"))
+    core, _ = small_layers
+    # both views give every torus the same hair count and control points
+    assert lod_layer_key(cache, core, 0.5) == lod_layer_key(cache, core, 0.6)
+    # a thumbnail from further away drops control points
+    assert lod_layer_key(cache, core, 0.5) != lod_layer_key(cache, core, 3.0, 480, 270)
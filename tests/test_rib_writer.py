@@ -0,0 +1,133 @@
+import io
+import struct
+
+import numpy as np
+
+from ri_track import TrackedRi
+from rib_writer import RibFile, RibWriter
+from yarn_layer import SceneBuild, emit_layer
+
+
+def binary_rib(*requests):
+    f = io.BytesIO()
+    rib = RibWriter(f, binary=True)
+    for name, args in requests:
+        getattr(rib, name)(*args)
+    return f.getvalue()
+
+
+def decode(data):
+    # a binary RIB back to (request name, values) pairs, arrays as lists
+    names, requests, define = {}, [], None
+    stack, i = [[]], 0
+    while i < len(data):
+        code = data[i]
+        i += 1
+        if 0x80 <= code <= 0x83:
+            width = code - 0x7f
+            value = int.from_bytes(data[i:i + width], "big", signed=True)
+            i += width
+        elif 0x90 <= code <= 0x9f or code == 0xa3:
+            size = code - 0x90 if code != 0xa3 else struct.unpack(">I", data[i:i + 4])[0]
+            i += 0 if code != 0xa3 else 4
+            value = data[i:i + size].decode()
+            i += size
+        elif code == 0xa4:
+            value = struct.unpack(">f", data[i:i + 4])[0]
+            i += 4
+        elif code == 0xcb:
+            size, = struct.unpack(">I", data[i:i + 4])
+            value = np.frombuffer(data[i + 4:i + 4 + 4 * size], dtype=">f4").tolist()
+            i += 4 + 4 * size
+        elif code == 0xcc:
+            define = data[i]
+            i += 1
+            continue
+        elif code == 0xa6:
+            requests.append((names[data[i]], []))
+            stack = [requests[-1][1]]
+            i += 1
+            continue
+        elif code == ord("["):
+            stack[-1].append([])
+            stack.append(stack[-1][-1])
+            continue
+        elif code == ord("]"):
+            stack.pop()
+            continue
+        else:
+            raise ValueError("unexpected code {:#x} at {}".format(code, i - 1))
+        if define is not None:
+            names[define], define = value, None
+        else:
+            stack[-1].append(value)
+    return requests
+
+
+def test_binary_golden_bytes():
+    assert binary_rib(("Sphere", (1, -2, 300, 70000))) == (
+        b"\xcc\x00\x96Sphere"
+        b"\xa6\x00\x80\x01\x80\xfe\x81\x01\x2c\x83\x00\x01\x11\x70")
+    assert binary_rib(("Attribute", ("identifier", {"string name": "a long name for a string"}))) == (
+        b"\xcc\x00\x99Attribute\xa6\x00\x9aidentifier\x9bstring name"
+        b"[\xa3\x00\x00\x00\x18a long name for a string]")
+    assert binary_rib(("Translate", (0.5, 1.0, 2.0))) == (
+        b"\xcc\x00\x99Translate\xa6\x00" + b"".join(b"\xa4" + struct.pack(">f", v) for v in (0.5, 1.0, 2.0)))
+
+
+def test_binary_round_trip():
+    P = np.linspace(-1, 1, 30, dtype=np.float32)
+    f = io.BytesIO()
+    rib = RibWriter(f, binary=True)
+    rib.Curves("cubic", [4, 7], "nonperiodic", {"P": P, "constantwidth": 0.001, "int ids": [3, -40000]})
+    rib.Curves("linear", [2], "periodic", {"P": P[:6]})
+    # written a block at a time
+    big = np.arange(3 * RibWriter.FLOAT_BLOCK + 5, dtype=np.float32)
+    rib.Points({"P": big, "constantwidth": 0.5})
+    data = f.getvalue()
+    # the name is defined once, the second request only refers to its code
+    assert data.count(b"Curves") == 1
+    assert decode(data) == [
+        ("Curves", ["cubic", [4, 7], "nonperiodic", "P", P.tolist(),
+                    "constantwidth", [float(np.float32(0.001))], "int ids", [3, -40000]]),
+        ("Curves", ["linear", [2], "periodic", "P", P[:6].tolist()]),
+        ("Points", ["P", big.tolist(), "constantwidth", [0.5]]),
+    ]
+
+
+def test_binary_untyped_ints_stay_ints():
+    data = binary_rib(("Attribute", ("visibility", {"camera": [1]})),
+                      ("Option", ("statistics", {"endofframe": [1]})),
+                      ("Attribute", ("dice", {"float micropolygonlength": 1})))
+    # 0x80 is a one byte int, floats would be a 0xcb array
+    assert b"\x96camera[\x80\x01]" in data
+    assert b"\x9aendofframe[\x80\x01]" in data
+    assert decode(data) == [
+        ("Attribute", ["visibility", "camera", [1]]),
+        ("Option", ["statistics", "endofframe", [1]]),
+        ("Attribute", ["dice", "float micropolygonlength", [1.0]]),
+    ]
+    assert b"\xcb\x00\x00\x00\x01" + struct.pack(">f", 1.0) in data
+
+
+def test_scene_sections_cover_the_layers(tmp_path, small_layers, layer_rib):
+    core, top = small_layers
+    path = str(tmp_path / "scene.rib")
+    rib = RibFile()
+    ri = TrackedRi(rib)
+    build = SceneBuild(ri, hairfraction=0.05, scene_rib=rib)
+    ri.Begin(path)
+    try:
+        emit_layer(build, core, covered_by=[top])
+        emit_layer(build, top, core=core)
+    finally:
+        ri.End()
+        build.close()
+    with open(path, "rb") as f:
+        scene = f.read()
+    assert scene == layer_rib("direct")
+
+    offsets = build.rib_stats.offsets
+    assert offsets["scene " + core["name"]] == (0, offsets["scene " + top["name"]][0])
+    assert offsets["scene " + top["name"]][1] == len(scene)
+    assert build.rib_stats.sections["scene " + top["name"]][0] == len(scene) - offsets["scene " + top["name"]][0]
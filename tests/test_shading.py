@@ -0,0 +1,19 @@
+import collections
+
+SHADING = ("Bxdf", "Pattern", "Displace")
+GEOMETRY = ("Torus", "Curves")
+
+
+def requests(rib, names):
+    return collections.Counter(line for line in rib.decode().splitlines() if line.split(" ", 1)[0] in names)
+
+
+def test_shared_shading_declares_each_network_once_per_layer(layer_rib):
+    plain = layer_rib("plain")
+    shared = layer_rib("shared", shared_shading=True)
+    # the same shading networks, the surface and the hair Bxdf once for each of the two layers
+    assert set(requests(shared, SHADING)) == set(requests(plain, SHADING))
+    assert sum(requests(shared, ("Bxdf",)).values()) == 4
+    assert sum(requests(plain, ("Bxdf",)).values()) == 2 * (12 + 4)
+    # and the same tori and hair
+    assert requests(shared, GEOMETRY) == requests(plain, GEOMETRY)
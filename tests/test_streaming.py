@@ -0,0 +1,103 @@
+import io
+import os
+import shlex
+import sys
+
+import numpy as np
+
+from hair_pool import HairPipeline, hair_bytes, stream_layer_hair
+from ri_track import TrackedRi
+from rib_stream import RibStream
+from rib_writer import RibWriter
+from yarn_layer import HairBatch, SceneBuild, emit_layer, transform_points
+
+
+JOBS = [{"count": 40, "major_radius": 0.05, "minor_radius": 0.002, "hair_length": 0.001,
+         "num_control_points": 10}] * 6
+
+
+def flatten(stream):
+    return [(i, [None if s is None else tuple(np.asarray(a).tobytes() for a in s) for s in pieces])
+            for i, pieces in stream]
+
+
+def test_budget_groups_without_changing_hair():
+    jobs = JOBS[:2] + [None] + JOBS[3:]
+    whole = flatten(stream_layer_hair(11, jobs))
+    assert [i for i, _ in whole] == list(range(6))
+    assert whole[2][1] == [None]
+    assert flatten(stream_layer_hair(11, jobs, budget=2 * hair_bytes(JOBS[0]))) == whole
+
+
+def test_torus_over_budget_is_split():
+    pieces = flatten(stream_layer_hair(11, JOBS[:1], budget=hair_bytes(JOBS[0]) // 4))[0][1]
+    assert len(pieces) == 4
+    assert sum(np.frombuffer(p[1], dtype=np.int32).size for p in pieces) == JOBS[0]["count"]
+
+
+def test_pipeline_keeps_order_and_hair():
+    whole = flatten(stream_layer_hair(11, JOBS))
+    assert flatten(HairPipeline(stream_layer_hair(11, JOBS, budget=hair_bytes(JOBS[0])), 2)) == whole
+
+
+def test_hair_budget_and_pipeline_give_identical_rib(layer_rib):
+    # RibWriter takes buffers, so the budget of about two and a half tori is not
+    # shrunk for python lists and no torus is split
+    plain = layer_rib("plain", buffers="buffers")
+    assert layer_rib("budget", buffers="buffers", hairbudget=0.05) == plain
+    assert layer_rib("pipeline", buffers="buffers", pipeline=2) == plain
+    assert layer_rib("all", buffers="buffers", hairbudget=0.05, pipeline=2, workers=2) == plain
+
+
+def test_hair_batch_flushes_before_the_budget(small_layers):
+    build = SceneBuild(TrackedRi(RibWriter(io.BytesIO())), buffers="buffers", hairbudget=1)
+    emitted = []
+    build.emitter.curves = lambda nvertices, P, width: emitted.append((nvertices.copy(), P.copy(), width.copy()))
+    batch = HairBatch(build, small_layers[0])
+    rng = np.random.default_rng(5)
+    pieces = []
+    for _ in range(12):
+        nvertices = np.full(2000, 10, dtype=np.int32)
+        pieces.append((rng.normal(size=(20000, 3)).astype(np.float32), nvertices,
+                       np.full(20000, 0.001, dtype=np.float32)))
+    matrix = np.identity(4)
+    matrix[3, :3] = (0.1, 0.2, 0.3)
+    for piece in pieces:
+        batch.add(matrix, *piece)
+    batch.flush()
+
+    # 12 pieces of 0.33 MB, three fit under 1 MB and a fourth would take it over
+    assert batch.primitives == len(emitted) == 4
+    assert all(sum(a.nbytes for a in primitive) <= 1024 * 1024 for primitive in emitted)
+    assert np.array_equal(np.concatenate([P for _, P, _ in emitted]),
+                          np.concatenate([transform_points(piece[0], matrix) for piece in pieces]))
+
+
+def test_stream_carries_the_scene_rib(tmp_path, small_layers, layer_rib):
+    # a consumer that copies the stream to a file stands in for prman
+    path = str(tmp_path / "streamed.rib")
+    copy = "import shutil, sys; shutil.copyfileobj(sys.stdin.buffer, open(sys.argv[1], 'wb'))"
+    stream = RibStream(" ".join(shlex.quote(arg) for arg in (sys.executable, "-c", copy, path)), wait=True)
+    core, top = small_layers
+    build = SceneBuild(TrackedRi(stream), hairfraction=0.05)
+    stream.Begin()
+    try:
+        emit_layer(build, core, covered_by=[top])
+        emit_layer(build, top, core=core)
+    finally:
+        stream.End()
+        build.close()
+    assert stream.process.returncode == 0
+    with open(path, "rb") as f:
+        assert f.read() == layer_rib("direct")
+
+
+def test_rib_sink_reads_the_whole_stream(capfd):
+    sink = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "rib_sink.py")
+    stream = RibStream(" ".join(shlex.quote(arg) for arg in (sys.executable, sink)), binary=True, wait=True)
+    stream.Begin()
+    stream.Points({"P": np.zeros(3 * 100000, dtype=np.float32)})
+    stream.End()
+    written = stream.f.written
+    assert written > 1200000
+    assert "rib sink: {:.1f} MB".format(written / (1024 * 1024)) in capfd.readouterr().out
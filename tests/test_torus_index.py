@@ -0,0 +1,67 @@
+import numpy as np
+
+from torus_index import TorusIndex, buried_strands
+from yarn_layer import torus_matrices
+
+
+def brute_inside(points, matrices, majors, minor):
+    inside = np.zeros((len(points), len(matrices)), dtype=bool)
+    for j, (m, major) in enumerate(zip(matrices, majors)):
+        local = (points - m[3, :3]) @ m[:3, :3].T
+        ring = np.hypot(local[:, 0], local[:, 1]) - major
+        inside[:, j] = ring * ring + local[:, 2] ** 2 < minor * minor
+    return inside
+
+
+def random_tori(rng, n=6):
+    layout = np.zeros((n, 7))
+    layout[:, :3] = rng.uniform(-180, 180, (n, 3))
+    layout[:, 3:6] = rng.uniform(-0.05, 0.05, (n, 3))
+    layout[:, 6] = rng.uniform(0.9, 1.1, n)
+    return torus_matrices(layout), layout[:, 6]
+
+
+def test_inside_matches_brute_force():
+    rng = np.random.default_rng(2)
+    matrices, majors = random_tori(rng)
+    index = TorusIndex(matrices, majors, 0.1)
+    points = rng.uniform(-1.2, 1.2, (5000, 3))
+    expected = brute_inside(points, matrices, majors, 0.1)
+
+    assert np.array_equal(index.inside(points), expected.any(axis=1))
+    others = np.delete(expected, 2, axis=1).any(axis=1)
+    assert np.array_equal(index.inside(points, exclude=2), others)
+
+
+def test_reach_covers_the_widest_sample_gap():
+    # the tiny torus is sampled far more densely than the big one, a point inside the
+    # big tube halfway between two of its samples must still be found
+    matrices = torus_matrices(np.array([[0, 0, 0, 0, 0, 0, 1.0], [0, 0, 0, 0, 0, 0, 0.01]]))
+    index = TorusIndex(matrices, [1.0, 0.01], 0.1)
+    a = np.pi / 63 # 63 samples around the big circle
+    point = np.array([[1.099 * np.cos(a), 1.099 * np.sin(a), 0.0]])
+    assert index.inside(point)[0]
+    assert not index.inside(point, exclude=0)[0]
+
+
+def test_buried_strands_drop_roots_and_tips_inside_other_tori():
+    matrices = torus_matrices(np.array([[0, 0, 0, 0, 0, 0, 1.0], [0, 0, 0, 0, 0, 0.5, 1.0]]))
+    index = TorusIndex(matrices, [1.0, 1.0], 0.2)
+    # strands of torus 0 in its own frame: root and tip inside torus 1, root inside
+    # torus 1 with the tip outside the layer, and one clear of torus 1
+    curves = np.array([
+        [[1.0, 0, 0.45], [1.0, 0, 0.5]],
+        [[1.0, 0, 0.45], [1.0, 0, 2.0]],
+        [[1.0, 0, 0.15], [1.0, 0, 0.1]],
+    ], dtype=np.float32)
+    strands = (curves.reshape(-1), np.full(3, 2, dtype=np.int32), np.full(3, 0.01, dtype=np.float32))
+
+    (P, nvertices, width), rejected = buried_strands(index, 0, strands, matrices[0])
+    assert rejected == 1
+    assert np.array_equal(P.reshape(-1, 2, 3), curves[1:])
+    assert len(nvertices) == len(width) == 2
+
+
+def test_buried_strands_without_hair():
+    matrices, majors = random_tori(np.random.default_rng(0), 2)
+    assert buried_strands(TorusIndex(matrices, majors, 0.1), 0, None, matrices[0]) == (None, 0)
@@ -0,0 +1,43 @@
+import copy
+import io
+
+import pytest
+
+from render_image_TWO import (WHITE_CORE_LAYER, WHITE_TOP_LAYER, RED_CORE_LAYER, RED_TOP_LAYER,
+                              RED_CORE_INSTANCE, RED_TOP_INSTANCE)
+from ri_track import TrackedRi
+from rib_writer import RibWriter
+from yarn_ball import YarnBall, layer_material
+from yarn_layer import SceneBuild
+
+
+def small_ball(red_core=RED_CORE_INSTANCE, red_top=RED_TOP_INSTANCE):
+    core, top = copy.deepcopy(WHITE_CORE_LAYER), copy.deepcopy(WHITE_TOP_LAYER)
+    core["num_tori"], top["num_tori"] = 6, 2
+    return YarnBall("ball", [(core, {"covered_by": [top]}), (top, {"core": core})], {
+        "white": [layer_material(core), layer_material(top)],
+        "red": [red_core, red_top],
+    })
+
+
+def test_one_prototype_with_per_instance_material():
+    ball = small_ball()
+    f = io.BytesIO()
+    build = SceneBuild(TrackedRi(RibWriter(f)), hairfraction=0.01)
+    ball.declare(build)
+    ball.instance(build.ri, "white")
+    ball.instance(build.ri, "red")
+    rib = f.getvalue().decode()
+
+    assert rib.count("ObjectBegin") == 1
+    assert rib.count('ObjectInstance "ball"') == 2
+    # the red instance sets its own colour over the shared geometry
+    assert "user:yarn0_colour_colorA" in rib
+    assert '"color yarn0_colour_colorA" [0.75 0.06 0.047]' in rib
+    assert '"color yarn0_colour_colorA" [0.68 0.68 0.59]' in rib
+
+
+def test_rejects_an_instance_material_with_other_references():
+    # the red surface takes its roughness from another output of the spec pattern
+    with pytest.raises(ValueError):
+        small_ball(red_core=layer_material(RED_CORE_LAYER), red_top=layer_material(RED_TOP_LAYER))